@@ -0,0 +1,237 @@
+"""Общий для всех процессов кеш в файле SQLite.
+
+В отличие от LocMemCache, записи видны всем воркерам на одной машине,
+а значит, есть одна копия каждой страницы и инвалидация доходит до всех.
+Объём ограничен числом записей (MAX_ENTRIES) и размером (MAX_SIZE, байт);
+при переполнении вытесняются давно не читанные записи.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+# Время последнего чтения обновляется не чаще, чем раз в столько секунд,
+# чтобы попадание в кеш почти никогда не требовало записи.
+ACCESS_RESOLUTION = 1.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires REAL,
+    accessed REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed);
+CREATE TABLE IF NOT EXISTS cache_stats (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    entries INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO cache_stats VALUES (1, 0, 0);
+CREATE TRIGGER IF NOT EXISTS cache_insert AFTER INSERT ON cache BEGIN
+    UPDATE cache_stats SET entries = entries + 1, size = size + new.size;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_delete AFTER DELETE ON cache BEGIN
+    UPDATE cache_stats SET entries = entries - 1, size = size - old.size;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_update AFTER UPDATE OF size ON cache BEGIN
+    UPDATE cache_stats SET size = size - old.size + new.size;
+END;
+"""
+
+
+class SQLiteCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self._path = location
+        self._max_size = int(options.get("MAX_SIZE", 64 * 1024 * 1024))
+        self._busy_timeout = float(options.get("BUSY_TIMEOUT", 5))
+        self._local = threading.local()
+
+    @property
+    def _connection(self):
+        # Соединение своё у каждого потока и у каждого процесса после fork.
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(
+                self._path,
+                timeout=self._busy_timeout,
+                isolation_level=None,
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(SCHEMA)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    @contextmanager
+    def _write(self):
+        """Транзакция с блокировкой на запись сразу при открытии."""
+        connection = self._connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _is_expired(self, expires, now):
+        return expires is not None and expires <= now
+
+    def _store(self, connection, key, value, timeout, now):
+        blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        # INSERT OR REPLACE не запускает триггер удаления, и перезапись
+        # ключа сдвигала бы счётчики, поэтому существующая строка
+        # обновляется, а её размер учитывает триггер cache_update.
+        connection.execute(
+            "INSERT INTO cache VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET value = excluded.value, "
+            "expires = excluded.expires, accessed = excluded.accessed, "
+            "size = excluded.size",
+            (key, blob, self.get_backend_timeout(timeout), now, len(blob)))
+
+    def _cull(self, connection, now):
+        entries, size = connection.execute(
+            "SELECT entries, size FROM cache_stats").fetchone()
+        if entries <= self._max_entries and size <= self._max_size:
+            return
+        connection.execute(
+            "DELETE FROM cache WHERE expires IS NOT NULL AND expires <= ?",
+            (now,))
+        entries, size = connection.execute(
+            "SELECT entries, size FROM cache_stats").fetchone()
+        while entries > self._max_entries or size > self._max_size:
+            connection.execute(
+                "DELETE FROM cache WHERE key IN ("
+                "SELECT key FROM cache ORDER BY accessed LIMIT ?)",
+                (max(1, entries // self._cull_frequency),))
+            entries, size = connection.execute(
+                "SELECT entries, size FROM cache_stats").fetchone()
+
+    def _touch_accessed(self, keys, now):
+        self._connection.execute(
+            "UPDATE cache SET accessed = ? WHERE key IN (%s)"
+            % ", ".join("?" * len(keys)),
+            (now, *keys))
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        return self._get_many([key]).get(key, default)
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        return {
+            keys[key]: value
+            for key, value in self._get_many(list(keys)).items()
+        }
+
+    def _get_many(self, keys):
+        if not keys:
+            return {}
+        now = time.time()
+        rows = self._connection.execute(
+            "SELECT key, value, expires, accessed FROM cache "
+            "WHERE key IN (%s)" % ", ".join("?" * len(keys)),
+            keys).fetchall()
+        found = {}
+        stale = []
+        for key, blob, expires, accessed in rows:
+            if self._is_expired(expires, now):
+                continue
+            found[key] = pickle.loads(blob)
+            if now - accessed > ACCESS_RESOLUTION:
+                stale.append(key)
+        if stale:
+            self._touch_accessed(stale, now)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        with self._write() as connection:
+            self._store(connection, key, value, timeout, now)
+            self._cull(connection, now)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        now = time.time()
+        with self._write() as connection:
+            for key, value in data.items():
+                self._store(
+                    connection, self._key(key, version), value, timeout, now)
+            self._cull(connection, now)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        with self._write() as connection:
+            row = connection.execute(
+                "SELECT expires FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is not None and not self._is_expired(row[0], now):
+                return False
+            self._store(connection, key, value, timeout, now)
+            self._cull(connection, now)
+        return True
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        with self._write() as connection:
+            row = connection.execute(
+                "SELECT value, expires FROM cache WHERE key = ?",
+                (key,)).fetchone()
+            if row is None or self._is_expired(row[1], now):
+                raise ValueError("Key '%s' not found" % key)
+            value = pickle.loads(row[0]) + delta
+            blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            connection.execute(
+                "UPDATE cache SET value = ?, size = ?, accessed = ? "
+                "WHERE key = ?",
+                (blob, len(blob), now, key))
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        with self._write() as connection:
+            return connection.execute(
+                "UPDATE cache SET expires = ?, accessed = ? WHERE key = ? "
+                "AND (expires IS NULL OR expires > ?)",
+                (self.get_backend_timeout(timeout), now, key, now),
+            ).rowcount == 1
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        return self._connection.execute(
+            "SELECT 1 FROM cache WHERE key = ? "
+            "AND (expires IS NULL OR expires > ?)",
+            (key, time.time())).fetchone() is not None
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version=version)
+
+    def delete_many(self, keys, version=None):
+        keys = [self._key(key, version) for key in keys]
+        if keys:
+            with self._write() as connection:
+                connection.execute(
+                    "DELETE FROM cache WHERE key IN (%s)"
+                    % ", ".join("?" * len(keys)),
+                    keys)
+
+    def clear(self):
+        with self._write() as connection:
+            connection.execute("DELETE FROM cache")
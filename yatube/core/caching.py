@@ -0,0 +1,376 @@
+"""Версионированные ключи кеша.
+
+У каждой области данных («все посты», «группа», «автор») в кеше лежит
+счётчик поколения. Изменение данных области сдвигает счётчик, и ключи,
+собранные со старым значением, больше не читаются. Поэтому фрагменты
+страниц можно держать в кеше долго: они устаревают ровно тогда, когда
+меняются их данные.
+"""
+import hashlib
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db import connections
+from django.utils.safestring import mark_safe
+from django.views.decorators.http import condition
+
+from core import metrics
+
+GENERATION_PREFIX = "generation:"
+LOCK_PREFIX = "lock:"
+# Атрибут запроса: страница нарисована с куском, который скоро изменится.
+INCOMPLETE_PAGE = "_incomplete_page"
+# Как часто проверять, не появилось ли значение, которое вычисляет
+# другой процесс.
+POLL_INTERVAL = 0.02
+
+logger = logging.getLogger(__name__)
+
+_flights = {}
+_flights_lock = threading.Lock()
+_executors = {}
+_refreshing = set()
+_refresh_lock = threading.Lock()
+
+
+def new_generation():
+    # Начинаем с текущего времени, чтобы после вытеснения счётчика из кеша
+    # он не вернулся к значению, с которым уже собирались ключи.
+    return int(time.time() * 1000)
+
+
+def get_generations(*scopes):
+    """Текущие поколения областей одним запросом к кешу."""
+    keys = [GENERATION_PREFIX + scope for scope in scopes]
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    metrics.record_cache(hits=len(found), misses=len(missing))
+    if missing:
+        for key in missing:
+            cache.add(key, new_generation(), timeout=None)
+        found.update(cache.get_many(missing))
+    return [found.get(key, 0) for key in keys]
+
+
+def get_version(*scopes):
+    """Строка версии для ключа кеша, зависящего от данных областей."""
+    return ".".join(map(str, get_generations(*scopes)))
+
+
+def page_etag(request, *scopes):
+    """Слабый ETag страницы, зависящей от данных областей и читателя.
+
+    Пока поколения областей не сдвинулись, страница для того же адреса,
+    того же пользователя и того же секрета CSRF не меняется, и ответ
+    можно не рисовать. Секрет меняется при каждом входе, и форма
+    со старым токеном уже не отправится. Слабый ETag потому, что HTML
+    может отличаться побайтно, например маской CSRF-токена.
+    """
+    user = request.user
+    validator = ":".join([
+        get_version(*scopes),
+        request.get_full_path(),
+        f"{user.pk}:{user.get_username()}" if user.is_authenticated else "",
+        request.META.get("CSRF_COOKIE", ""),
+    ])
+    return 'W/"%s"' % hashlib.md5(validator.encode()).hexdigest()
+
+
+def mark_page_incomplete(request):
+    """Не отдавать ETag страницы: часть её скоро изменится сама."""
+    setattr(request, INCOMPLETE_PAGE, True)
+
+
+def page_condition(etag_func):
+    """``condition(etag_func=...)``, но без ETag у незавершённых страниц.
+
+    Иначе на заглушку вместо превью, которое ещё рисуется, браузер
+    получал бы 304, пока не сдвинутся поколения областей страницы.
+    """
+    def decorator(view):
+        conditional_view = condition(etag_func=etag_func)(view)
+
+        @wraps(view)
+        def inner(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if getattr(request, INCOMPLETE_PAGE, False):
+                del response["ETag"]
+            return response
+        return inner
+    return decorator
+
+
+class Flight:
+    """Вычисление значения, которого ждут другие потоки процесса."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+
+
+def get_or_set(key, compute, timeout=DEFAULT_TIMEOUT):
+    """Значение из кеша, а при промахе — вычисленное ``compute``.
+
+    Попадания и промахи учитываются в метриках запроса. Одновременные
+    промахи по одному ключу вычисляют значение один раз, см. single_flight.
+    """
+    value = cache.get(key)
+    metrics.record_cache(hits=value is not None, misses=value is None)
+    if value is None:
+        value = single_flight(key, compute, timeout)
+    return value
+
+
+def single_flight(key, compute, timeout, accept=None):
+    """Вычислить и сохранить значение ключа один раз на все воркеры.
+
+    Потоки процесса ждут первого из них, а процессы — того, кто первым
+    взял блокировку ключа в кеше, но не дольше SINGLE_FLIGHT_WAIT секунд:
+    если значение так и не появилось, его вычисляют сами. ``accept``
+    отличает новое значение в кеше от устаревшего, которое там уже было.
+    """
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = Flight()
+    if not leader:
+        flight.done.wait(settings.SINGLE_FLIGHT_WAIT)
+        if flight.value is None:
+            return unwrap(compute())
+        return flight.value
+    try:
+        flight.value = compute_once(key, compute, timeout, accept)
+        return flight.value
+    finally:
+        with _flights_lock:
+            del _flights[key]
+        flight.done.set()
+
+
+def compute_once(key, compute, timeout, accept=None):
+    """Вычислить значение под блокировкой ключа в кеше."""
+    def cached():
+        value = cache.get(key)
+        if value is not None and (accept is None or accept(value)):
+            return value
+        return None
+
+    lock = LOCK_PREFIX + key
+    deadline = time.monotonic() + settings.SINGLE_FLIGHT_WAIT
+    waited = False
+    while not cache.add(lock, 1, settings.SINGLE_FLIGHT_LOCK_TIMEOUT):
+        # Значение вычисляет другой процесс.
+        if time.monotonic() >= deadline:
+            return store(key, compute(), timeout)
+        time.sleep(POLL_INTERVAL)
+        waited = True
+        value = cached()
+        if value is not None:
+            return value
+    try:
+        # Прежний владелец мог сохранить значение перед снятием блокировки.
+        value = cached() if waited else None
+        return value if value is not None else store(key, compute(), timeout)
+    finally:
+        cache.delete(lock)
+
+
+class Uncached:
+    """Результат вычисления, который отдаётся, но не сохраняется в кеш."""
+
+    def __init__(self, value):
+        self.value = value
+
+
+def unwrap(value):
+    return value.value if isinstance(value, Uncached) else value
+
+
+def store(key, value, timeout):
+    if isinstance(value, Uncached):
+        return value.value
+    cache.set(key, value, timeout)
+    return value
+
+
+def bump(*scopes):
+    """Сдвинуть поколения областей после изменения их данных."""
+    for scope in set(scopes):
+        key = GENERATION_PREFIX + scope
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, new_generation(), timeout=None)
+
+
+def get_or_refresh(key, compute, timeout, grace, pool, workers,
+                   compute_later=None):
+    """Значение из кеша, которое после ``timeout`` ещё ``grace`` секунд
+    отдаётся устаревшим, пока фоновый поток вычисляет новое.
+
+    ``pool`` — имя пула фоновых потоков на ``workers`` потоков, например
+    представление. ``compute_later`` — то же вычисление, но пригодное для
+    фонового потока, если ``compute`` опирается на состояние запроса.
+    Без потоков (``workers=0``) или на базе SQLite в памяти устаревшее
+    значение вычисляется заново прямо в запросе.
+    """
+    entry = cache.get(key)
+    metrics.record_cache(hits=entry is not None, misses=entry is None)
+    if entry is not None:
+        value, fresh_until = entry
+        if time.time() < fresh_until:
+            return value
+        if grace and workers and in_background():
+            refresh(key, compute_later or compute, timeout, grace, pool,
+                    workers)
+            return value
+    return single_flight(
+        key, lambda: make_entry(compute(), timeout), timeout + grace,
+        accept=lambda entry: time.time() < entry[1])[0]
+
+
+def make_entry(value, timeout):
+    """Запись get_or_refresh: значение и срок его свежести."""
+    if isinstance(value, Uncached):
+        return Uncached((value.value, time.time() + timeout))
+    return value, time.time() + timeout
+
+
+def in_background():
+    """Можно ли обновлять значения в фоновых потоках.
+
+    Потоки с базой SQLite в памяти делят её с блокировкой целых таблиц
+    и мешают основному потоку, как и у превью картинок.
+    """
+    connection = connections["default"]
+    return not (
+        connection.vendor == "sqlite" and connection.is_in_memory_db())
+
+
+def get_executor(pool, workers):
+    with _refresh_lock:
+        executor = _executors.get(pool)
+        if executor is None:
+            executor = _executors[pool] = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix=f"refresh:{pool}")
+        return executor
+
+
+def refresh(key, compute, timeout, grace, pool, workers):
+    """Поставить обновление ключа в очередь пула, если его ещё не ведут."""
+    lock = LOCK_PREFIX + key
+    with _refresh_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+    # Ключ обновляет один поток на все процессы.
+    if not cache.add(lock, 1, settings.SINGLE_FLIGHT_LOCK_TIMEOUT):
+        with _refresh_lock:
+            _refreshing.discard(key)
+        return
+    get_executor(pool, workers).submit(
+        refresh_in_worker, key, compute, timeout, grace)
+
+
+def refresh_in_worker(key, compute, timeout, grace):
+    try:
+        store(key, make_entry(compute(), timeout), timeout + grace)
+    except Exception:
+        logger.exception("Не удалось обновить %s", key)
+    finally:
+        cache.delete(LOCK_PREFIX + key)
+        with _refresh_lock:
+            _refreshing.discard(key)
+        connections.close_all()
+
+
+class Fragment:
+    """Кешируемый кусок шаблона: имя и ``vary_on`` задают ключ.
+
+    ``vary_on`` должен включать версию данных фрагмента, а сам фрагмент
+    не должен зависеть от пользователя: его HTML общий для всех читателей.
+    Через ``timeout`` секунд фрагмент ещё ``grace`` секунд отдаётся
+    устаревшим, пока его заново рисует один из ``refresh_workers`` фоновых
+    потоков фрагментов с тем же именем.
+    """
+
+    def __init__(self, name, vary_on, timeout, grace=0, refresh_workers=0):
+        self.name = name
+        self.key = "fragment:%s:%s" % (
+            name,
+            hashlib.md5(":".join(map(str, vary_on)).encode()).hexdigest())
+        self.timeout = timeout
+        self.grace = grace
+        self.refresh_workers = refresh_workers
+
+    def get_or_render(self, render, render_later=None):
+        """Готовый HTML фрагмента из кеша или отрисованный заново."""
+        return mark_safe(get_or_refresh(
+            self.key, render, self.timeout, self.grace, self.name,
+            self.refresh_workers, render_later))
+
+
+class FragmentState:
+    """Можно ли класть отрисованный фрагмент в кеш.
+
+    Кусок, который скоро изменится сам (превью картинки ещё в очереди),
+    помечает незавершёнными фрагмент и все объемлющие его фрагменты,
+    и они не сохраняются.
+    """
+
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.complete = True
+
+    def mark_incomplete(self):
+        state = self
+        while state is not None:
+            state.complete = False
+            state = state.parent
+
+
+class Cards:
+    """Фрагменты объектов одной страницы, например карточки постов.
+
+    Ключ карточки — объект и его ``get_card_version()``, которая меняется
+    вместе со всем, что выводится в карточке, поэтому карточки не нужно
+    сбрасывать. Все карточки страницы читаются одним ``get_many``,
+    а отрисованные заново пишутся одним ``set_many`` после последней.
+    """
+
+    def __init__(self, objects, vary_on, timeout):
+        self.objects = objects
+        self.timeout = timeout
+        suffix = ":".join(map(str, vary_on))
+        self.keys = {
+            obj.pk: "card:%s" % hashlib.md5(
+                f"{obj._meta.label}:{obj.pk}:{obj.get_card_version()}:"
+                f"{suffix}".encode()).hexdigest()
+            for obj in objects
+        }
+        self.found = cache.get_many(self.keys.values())
+        metrics.record_cache(
+            hits=len(self.found), misses=len(self.keys) - len(self.found))
+        self.rendered = {}
+        self.left = len(self.keys)
+
+    def get(self, obj):
+        html = self.found.get(self.keys[obj.pk])
+        return None if html is None else mark_safe(html)
+
+    def add(self, obj, html, complete):
+        if complete:
+            self.rendered[self.keys[obj.pk]] = html
+
+    def done(self):
+        """Отметить, что карточка выведена; после последней — записать."""
+        self.left -= 1
+        if not self.left and self.rendered:
+            cache.set_many(self.rendered, self.timeout)
@@ -0,0 +1,46 @@
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from core.cache_backends import SQLiteCache
+
+
+class Command(BaseCommand):
+    help = "Сравнивает задержку попадания в LocMemCache и в общий кеш SQLite."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--keys", type=int, default=1000)
+        parser.add_argument("--reads", type=int, default=20000)
+        parser.add_argument(
+            "--value-size", type=int, default=20000,
+            help="Размер значения в байтах, по умолчанию — страница ленты.")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, keys, reads, value_size, seed, **options):
+        value = "x" * value_size
+        params = {"OPTIONS": {"MAX_ENTRIES": keys * 2}}
+        with tempfile.TemporaryDirectory() as directory:
+            backends = {
+                "locmem": LocMemCache("bench_cache", params),
+                "shared": SQLiteCache(
+                    os.path.join(directory, "cache.sqlite3"), params),
+            }
+            for name, cache in backends.items():
+                cache.set_many({f"key:{i}": value for i in range(keys)})
+                picks = random.Random(seed)
+                timings = []
+                for _ in range(reads):
+                    key = f"key:{picks.randrange(keys)}"
+                    started = time.perf_counter()
+                    cache.get(key)
+                    timings.append((time.perf_counter() - started) * 1e6)
+                timings.sort()
+                self.stdout.write(
+                    f"{name:>7}: среднее {statistics.mean(timings):8.1f} мкс, "
+                    f"p50 {timings[len(timings) // 2]:8.1f} мкс, "
+                    f"p99 {timings[int(len(timings) * 0.99)]:8.1f} мкс")
@@ -0,0 +1,203 @@
+"""Метрики запросов по представлениям в формате Prometheus.
+
+MetricsMiddleware собирает по каждому запросу время ответа, число и время
+SQL-запросов, попадания в кеш и время отрисовки шаблонов и складывает их
+в гистограммы с метками по имени представления (``posts:profile``).
+Гистограммы — счётчики по фиксированным корзинам, поэтому запись стоит
+один bisect и несколько сложений под общей блокировкой.
+
+Метрики живут в памяти процесса: при нескольких воркерах каждый отдаёт
+свои, как обычно и опрашивает Prometheus.
+"""
+import math
+import threading
+from bisect import bisect_left
+from time import perf_counter
+
+from django.template.backends import django as django_backend
+
+# Границы корзин в секундах, как у клиентских библиотек Prometheus.
+SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERIES = (1, 2, 5, 10, 20, 50, 100, 200)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def format_labels(names, values):
+    return ",".join(
+        '%s="%s"' % (name, str(value).replace("\\", r"\\")
+                     .replace('"', r'\"').replace("\n", r"\n"))
+        for name, value in zip(names, values))
+
+
+def format_number(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.series = {}
+
+    def inc(self, labels, amount=1):
+        self.series[labels] = self.series.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, value in sorted(self.series.items()):
+            yield self.name, format_labels(self.labels, labels), value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labels, buckets):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, labels, value):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def samples(self):
+        for labels, (counts, total) in sorted(self.series.items()):
+            prefix = format_labels(self.labels, labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                yield (
+                    f"{self.name}_bucket",
+                    f'{prefix},le="{format_number(bound)}"',
+                    cumulative)
+            yield f"{self.name}_sum", prefix, total
+            yield f"{self.name}_count", prefix, cumulative
+
+
+REQUESTS = Counter(
+    "yatube_responses_total", "Ответы по представлениям и классам кодов.",
+    ("view", "status"))
+DURATION = Histogram(
+    "yatube_request_duration_seconds", "Время ответа представления.",
+    ("view",), SECONDS)
+DB_QUERIES = Histogram(
+    "yatube_db_queries", "Число SQL-запросов на запрос.",
+    ("view",), QUERIES)
+DB_DURATION = Histogram(
+    "yatube_db_duration_seconds", "Время SQL-запросов на запрос.",
+    ("view",), SECONDS)
+TEMPLATE_DURATION = Histogram(
+    "yatube_template_duration_seconds", "Время отрисовки шаблонов на запрос.",
+    ("view",), SECONDS)
+CACHE = Counter(
+    "yatube_cache_requests_total", "Чтения кеша: попадания и промахи.",
+    ("view", "result"))
+METRICS = [REQUESTS, DURATION, DB_QUERIES, DB_DURATION, TEMPLATE_DURATION,
+           CACHE]
+
+
+class RequestMetrics:
+    """Счётчики одного запроса; заодно обёртка выполнения SQL."""
+    __slots__ = ("queries", "db_time", "template_time", "cache_hits",
+                 "cache_misses")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += perf_counter() - started
+
+
+def activate(stats):
+    _local.stats = stats
+
+
+def deactivate():
+    _local.stats = None
+
+
+def current():
+    """Счётчики запроса, который обрабатывает этот поток, если они есть."""
+    return getattr(_local, "stats", None)
+
+
+def record_cache(hits=0, misses=0):
+    stats = current()
+    if stats is not None:
+        stats.cache_hits += hits
+        stats.cache_misses += misses
+
+
+def observe(view, status, duration, stats):
+    labels = (view,)
+    with _lock:
+        REQUESTS.inc((view, f"{status // 100}xx"))
+        DURATION.observe(labels, duration)
+        DB_QUERIES.observe(labels, stats.queries)
+        DB_DURATION.observe(labels, stats.db_time)
+        TEMPLATE_DURATION.observe(labels, stats.template_time)
+        if stats.cache_hits:
+            CACHE.inc((view, "hit"), stats.cache_hits)
+        if stats.cache_misses:
+            CACHE.inc((view, "miss"), stats.cache_misses)
+
+
+def reset():
+    with _lock:
+        for metric in METRICS:
+            metric.series.clear()
+
+
+def expose():
+    """Все метрики в текстовом формате Prometheus."""
+    lines = []
+    with _lock:
+        for metric in METRICS:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{{{labels}}} {format_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+class Template(django_backend.Template):
+    def render(self, context=None, request=None):
+        stats = current()
+        if stats is None:
+            return super().render(context, request)
+        started = perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats.template_time += perf_counter() - started
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """Шаблоны Django с учётом времени отрисовки в метриках запроса."""
+
+    def from_string(self, template_code):
+        return Template(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return Template(super().get_template(template_name).template, self)
@@ -0,0 +1,63 @@
+from contextlib import ExitStack
+from time import perf_counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from core import metrics
+from core.slow_queries import SlowQueryRecorder
+
+
+class MetricsMiddleware:
+    """Метрики запроса по имени представления; включается METRICS_ENABLED.
+
+    Стоит первой в MIDDLEWARE, чтобы время ответа включало остальные
+    промежуточные слои. У потоковых ответов учитывается время до начала
+    отдачи, а не до конца потока.
+    """
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = metrics.RequestMetrics()
+        started = perf_counter()
+        metrics.activate(stats)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(stats))
+                response = self.get_response(request)
+        finally:
+            metrics.deactivate()
+        match = request.resolver_match
+        metrics.observe(
+            match.view_name if match else "",
+            response.status_code,
+            perf_counter() - started,
+            stats)
+        return response
+
+
+class SlowQueryMiddleware:
+    """Журнал медленных запросов к базе; SLOW_QUERY_THRESHOLD = None
+    выключает его."""
+
+    def __init__(self, get_response):
+        if settings.SLOW_QUERY_THRESHOLD is None:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = SlowQueryRecorder(
+            request,
+            settings.SLOW_QUERY_THRESHOLD,
+            settings.SLOW_QUERY_EXPLAIN_RATE,
+        )
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            return self.get_response(request)
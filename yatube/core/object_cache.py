@@ -0,0 +1,228 @@
+"""Кеш объектов моделей по ключевым полям.
+
+``ObjectCache`` отвечает на поиск объекта по первичному ключу или другому
+уникальному полю (slug, username) из общего кеша, а перед ним — из
+небольшого LRU в памяти процесса, который обходится без обращения к кешу
+вообще. Отсутствующие объекты тоже запоминаются, на более короткий срок,
+чтобы перебор несуществующих адресов не доходил до базы.
+
+Записи удаляются при сохранении и удалении объекта, в том числе по старым
+значениям полей после переименования. Память другого процесса так
+не очистить, поэтому там записи живут не дольше OBJECT_CACHE_LOCAL_TIMEOUT.
+Массовые операции (update, bulk_create) сигналов не шлют: после них
+записи сбрасываются вызовом ``forget``.
+"""
+import copy
+import hashlib
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.http import Http404
+
+from core import metrics
+
+# Значение записи об отсутствующем объекте.
+MISSING = b""
+
+
+class LocalCache:
+    """LRU ограниченного размера со сроком жизни записей."""
+
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value, timeout):
+        if not self.size:
+            return
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + timeout)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def delete_many(self, keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class ObjectCache:
+    """Объекты ``queryset`` по полям ``fields`` из кеша.
+
+    ``related`` — связи, которые при промахе читаются тем же запросом.
+    Связанные объекты моделей, у которых тоже есть ObjectCache, кладутся
+    в свои кеши и при попадании подставляются из них; остальные связи
+    в кеш не попадают и читаются как обычно. Поля, отложенные
+    в ``queryset`` (например, хеш пароля), не сохраняются и у объектов,
+    прочитанных через связи другого кеша.
+    """
+    registry = {}
+
+    def __init__(self, queryset, fields=("pk",), related=()):
+        self.queryset = queryset
+        self.model = queryset.model
+        self.fields = fields
+        self.related = related
+        self.deferred = self.deferred_attnames(queryset)
+        self.local = LocalCache(settings.OBJECT_CACHE_LOCAL_SIZE)
+        self.registry[self.model] = self
+        uid = f"object_cache:{self.model._meta.label}"
+        pre_save.connect(
+            self.remember_keys, sender=self.model, dispatch_uid=uid)
+        post_save.connect(
+            self.invalidate, sender=self.model, dispatch_uid=uid)
+        post_delete.connect(
+            self.invalidate, sender=self.model, dispatch_uid=uid)
+
+    @staticmethod
+    def deferred_attnames(queryset):
+        names, defer = queryset.query.deferred_loading
+        return {
+            field.attname for field in queryset.model._meta.concrete_fields
+            if not field.primary_key and (field.name in names) == defer
+        }
+
+    @classmethod
+    def clear_local(cls):
+        """Очистить память процесса всех кешей, например вместе с общим."""
+        for object_cache in cls.registry.values():
+            object_cache.local.clear()
+
+    def key(self, field, value):
+        if field == "pk" or field == self.model._meta.pk.name:
+            field = "pk"
+        return "object:%s:%s:%s" % (
+            self.model._meta.label, field,
+            hashlib.md5(str(value).encode()).hexdigest())
+
+    def keys(self, instance):
+        return [
+            self.key(field, getattr(instance, field)) for field in self.fields]
+
+    def get(self, **lookup):
+        """Объект по одному полю; нет объекта — ``DoesNotExist``."""
+        (field, value), = lookup.items()
+        key = self.key(field, value)
+        data = self.local.get(key)
+        if data is None:
+            data = cache.get(key)
+            if data is not None:
+                self.local.set(
+                    key, data, settings.OBJECT_CACHE_LOCAL_TIMEOUT)
+        metrics.record_cache(hits=data is not None, misses=data is None)
+        if data is None:
+            return self.load(key, lookup)
+        if data == MISSING:
+            raise self.model.DoesNotExist
+        instance = pickle.loads(data)
+        for name in self.related:
+            self.attach(instance, name.split("__")[0])
+        return instance
+
+    def get_or_404(self, **lookup):
+        try:
+            return self.get(**lookup)
+        except self.model.DoesNotExist:
+            raise Http404(
+                f"{self.model._meta.object_name} не найден: {lookup}.")
+
+    def load(self, key, lookup):
+        try:
+            instance = self.queryset.select_related(*self.related).get(
+                **lookup)
+        except self.model.DoesNotExist:
+            self.store(
+                [key], MISSING, settings.OBJECT_CACHE_MISSING_TIMEOUT)
+            raise
+        self.add(instance)
+        for name in self.related:
+            self.add_related(instance, name.split("__"))
+        return instance
+
+    def add(self, instance):
+        """Положить объект в кеш под всеми его ключами."""
+        # Связи в кеше не хранятся: они меняются независимо от объекта.
+        stored = copy.copy(instance)
+        stored._state = copy.copy(instance._state)
+        stored._state.fields_cache = {}
+        for attname in self.deferred:
+            stored.__dict__.pop(attname, None)
+        self.store(
+            self.keys(instance), pickle.dumps(stored),
+            settings.OBJECT_CACHE_TIMEOUT)
+
+    def add_related(self, instance, path):
+        for name in path:
+            instance = instance._state.fields_cache.get(name)
+            if instance is None:
+                return
+            related_cache = self.registry.get(type(instance))
+            if related_cache is not None:
+                related_cache.add(instance)
+
+    def attach(self, instance, name):
+        field = self.model._meta.get_field(name)
+        related_cache = self.registry.get(field.related_model)
+        if related_cache is None or not field.concrete:
+            return
+        value = getattr(instance, field.attname)
+        if value is None:
+            return
+        try:
+            setattr(instance, name, related_cache.get(pk=value))
+        except field.related_model.DoesNotExist:
+            pass
+
+    def store(self, keys, data, timeout):
+        cache.set_many(dict.fromkeys(keys, data), timeout)
+        for key in keys:
+            self.local.set(
+                key, data, min(timeout, settings.OBJECT_CACHE_LOCAL_TIMEOUT))
+
+    def remember_keys(self, sender, instance, update_fields=None, **kwargs):
+        """Ключи по значениям полей до сохранения, на случай переименования."""
+        instance._object_cache_keys = []
+        fields = [field for field in self.fields if field != "pk"]
+        if instance._state.adding or not fields or (
+                update_fields is not None
+                and not set(fields) & set(update_fields)):
+            return
+        previous = self.model._default_manager.filter(
+            pk=instance.pk).values(*fields).first()
+        if previous:
+            instance._object_cache_keys = [
+                self.key(field, value) for field, value in previous.items()]
+
+    def invalidate(self, sender, instance, **kwargs):
+        self.delete(self.keys(instance) + getattr(
+            instance, "_object_cache_keys", []))
+
+    def forget(self, field, values):
+        """Сбросить записи по значениям поля, например после bulk_create."""
+        self.delete([self.key(field, value) for value in values])
+
+    def delete(self, keys):
+        cache.delete_many(keys)
+        self.local.delete_many(keys)
@@ -0,0 +1,122 @@
+"""Журнал медленных SQL-запросов без DEBUG.
+
+SlowQueryMiddleware оборачивает выполнение SQL на время запроса. Запрос
+дольше SLOW_QUERY_THRESHOLD попадает в кольцевой буфер последних
+SLOW_QUERY_LOG_SIZE записей и в логгер ``core.slow_queries`` (в settings
+его можно направить в ротируемый файл). Запись хранит представление,
+строку нашего кода, из которой пришёл запрос, а для доли
+SLOW_QUERY_EXPLAIN_RATE записей — план запроса. Быстрые запросы стоят
+одного замера времени, стек и план собираются только для медленных.
+"""
+import logging
+import os
+import random
+import threading
+import traceback
+from collections import deque
+from datetime import datetime
+from time import perf_counter
+
+from django.conf import settings
+from django.db.backends import utils as db_utils
+
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_entries = deque(maxlen=settings.SLOW_QUERY_LOG_SIZE)
+# Параметры и текст запроса обрезаются, чтобы буфер оставался небольшим.
+MAX_SQL_LENGTH = 2000
+MAX_PARAMS_LENGTH = 500
+CURSOR_FILE = db_utils.__file__
+# Обёртка шаблонов, через которую идёт любая отрисовка: её строка ничего
+# не говорит.
+SKIPPED_FILES = {metrics.__file__}
+
+
+def entries():
+    """Записи буфера, от новых к старым."""
+    with _lock:
+        return list(reversed(_entries))
+
+
+def clear():
+    with _lock:
+        _entries.clear()
+
+
+def call_site():
+    """Ближайшая к запросу строка кода проекта."""
+    stack = traceback.extract_stack()
+    # Обёртки выполнения SQL вызываются изнутри курсора Django, поэтому
+    # место ищется только среди тех, кто вызвал курсор.
+    for index, frame in enumerate(stack):
+        if frame.filename == CURSOR_FILE:
+            stack = stack[:index]
+            break
+    for frame in reversed(stack):
+        path = frame.filename
+        if (path.startswith(settings.BASE_DIR) and path not in SKIPPED_FILES
+                and "site-packages" not in path):
+            return (f"{os.path.relpath(path, settings.BASE_DIR)}:"
+                    f"{frame.lineno} in {frame.name}")
+    return ""
+
+
+def explain(connection, sql, params):
+    """План запроса в строках; ошибка возвращается вместо плана."""
+    try:
+        prefix = connection.ops.explain_query_prefix()
+        with connection.cursor() as cursor:
+            cursor.execute(f"{prefix} {sql}", params)
+            return [str(row[-1]) for row in cursor.fetchall()]
+    except Exception as error:
+        return [f"Ошибка EXPLAIN: {error}"]
+
+
+class SlowQueryRecorder:
+    """Обёртка выполнения SQL на время одного HTTP-запроса."""
+
+    def __init__(self, request, threshold, explain_rate):
+        self.request = request
+        self.threshold = threshold
+        self.explain_rate = explain_rate
+        self.explaining = False
+
+    def __call__(self, execute, sql, params, many, context):
+        if self.explaining:
+            return execute(sql, params, many, context)
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = perf_counter() - started
+            if duration >= self.threshold:
+                self.record(sql, params, many, context, duration)
+
+    def record(self, sql, params, many, context, duration):
+        match = self.request.resolver_match
+        entry = {
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "view": match.view_name if match else "",
+            "path": self.request.path,
+            "duration": duration,
+            "sql": sql[:MAX_SQL_LENGTH],
+            "params": "" if many else repr(params)[:MAX_PARAMS_LENGTH],
+            "site": call_site(),
+            "plan": None,
+        }
+        if (not many and sql.lstrip()[:6].upper() == "SELECT"
+                and random.random() < self.explain_rate):
+            self.explaining = True
+            try:
+                entry["plan"] = explain(context["connection"], sql, params)
+            finally:
+                self.explaining = False
+        with _lock:
+            _entries.append(entry)
+        logger.warning(
+            "%.1f мс %s (%s) %s%s", duration * 1e3, entry["view"],
+            entry["site"], entry["sql"],
+            "".join(f"\n    {step}" for step in entry["plan"] or []))
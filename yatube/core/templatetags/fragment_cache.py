@@ -0,0 +1,117 @@
+from copy import copy
+
+from django import template
+from django.conf import settings
+
+from core.caching import (
+    Cards, FragmentState, Uncached, mark_page_incomplete)
+
+register = template.Library()
+
+# Переменная контекста с состоянием фрагмента, который сейчас рисуется.
+FRAGMENT_STATE = "fragment_state"
+
+
+def render_fragment(nodelist, context):
+    """HTML фрагмента и можно ли его сохранить в кеш."""
+    state = FragmentState(context.get(FRAGMENT_STATE))
+    with context.push({FRAGMENT_STATE: state}):
+        html = nodelist.render(context)
+    return html, state.complete
+
+
+def mark_incomplete(context):
+    """Не кешировать фрагменты и страницу, где рисуется этот кусок."""
+    state = context.get(FRAGMENT_STATE)
+    if state is not None:
+        state.mark_incomplete()
+    request = getattr(context, "request", None)
+    if request is not None:
+        mark_page_incomplete(request)
+
+
+class FragmentCacheNode(template.Node):
+    def __init__(self, nodelist, fragment):
+        self.nodelist = nodelist
+        self.fragment = fragment
+
+    def render(self, context):
+        fragment = self.fragment.resolve(context)
+        if not fragment:
+            return self.nodelist.render(context)
+        # Фоновому потоку нужна своя копия контекста: этот к тому времени
+        # уже будет отрисован до конца.
+        snapshot = copy(context)
+        return fragment.get_or_render(
+            lambda: self.render_content(context),
+            lambda: self.render_content(snapshot))
+
+    def render_content(self, context):
+        html, complete = render_fragment(self.nodelist, context)
+        return html if complete else Uncached(html)
+
+
+@register.tag
+def fragmentcache(parser, token):
+    """Кешировать содержимое по описанию ``core.caching.Fragment``.
+
+    {% fragmentcache feed_cache %}...{% endfragmentcache %}
+
+    Без описания в контексте содержимое рисуется как обычно.
+    """
+    bits = token.split_contents()
+    if len(bits) != 2:
+        raise template.TemplateSyntaxError(
+            "'%s' takes exactly one argument" % bits[0])
+    nodelist = parser.parse(("endfragmentcache",))
+    parser.delete_first_token()
+    return FragmentCacheNode(nodelist, parser.compile_filter(bits[1]))
+
+
+class CardCacheNode(template.Node):
+    def __init__(self, nodelist, item, items, vary_on):
+        self.nodelist = nodelist
+        self.item = item
+        self.items = items
+        self.vary_on = vary_on
+
+    def render(self, context):
+        item = self.item.resolve(context)
+        items = self.items.resolve(context)
+        # Карточки страницы читаются при первой из них и живут до конца
+        # отрисовки шаблона.
+        cards = context.render_context.get(self)
+        if cards is None or cards.objects is not items:
+            cards = context.render_context[self] = Cards(
+                items,
+                [var.resolve(context) for var in self.vary_on],
+                settings.CARD_CACHE_TIMEOUT)
+        html = cards.get(item)
+        if html is None:
+            html, complete = render_fragment(self.nodelist, context)
+            cards.add(item, html, complete)
+        cards.done()
+        return html
+
+
+@register.tag
+def cardcache(parser, token):
+    """Кешировать карточку объекта из списка страницы.
+
+    {% for post in page_obj %}
+      {% cardcache post in page_obj "no-group" %}...{% endcardcache %}
+    {% endfor %}
+
+    Дополнительные аргументы входят в ключ, как у ``{% cache %}``.
+    """
+    bits = token.split_contents()
+    if len(bits) < 4 or bits[2] != "in":
+        raise template.TemplateSyntaxError(
+            "'%s' expects 'item in items [vary_on ...]'" % bits[0])
+    nodelist = parser.parse(("endcardcache",))
+    parser.delete_first_token()
+    return CardCacheNode(
+        nodelist,
+        parser.compile_filter(bits[1]),
+        parser.compile_filter(bits[3]),
+        [parser.compile_filter(bit) for bit in bits[4:]])
@@ -0,0 +1,19 @@
+from django import template
+
+from core.thumbnails import get_or_schedule
+from .fragment_cache import mark_incomplete
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def queued_thumbnail(context, file_, geometry_string, **options):
+    """Готовое превью картинки или None, пока оно рисуется в фоне.
+
+    Пока превью нет, фрагменты с ним не сохраняются в кеш, иначе там
+    надолго остался бы заполнитель вместо картинки.
+    """
+    thumbnail = get_or_schedule(file_, geometry_string, **options)
+    if thumbnail is None and file_:
+        mark_incomplete(context)
+    return thumbnail
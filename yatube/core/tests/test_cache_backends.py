@@ -0,0 +1,83 @@
+import os
+import shutil
+import tempfile
+import time
+
+from django.test import SimpleTestCase
+
+from core.cache_backends import SQLiteCache
+
+
+class SQLiteCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.location = os.path.join(self.directory, "cache.sqlite3")
+        self.cache = self.make_cache()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def make_cache(self, **options):
+        return SQLiteCache(self.location, {"OPTIONS": options})
+
+    def test_entries_are_shared_between_instances(self):
+        """Запись видна другому экземпляру кеша, как другому воркеру."""
+        self.cache.set("page", {"html": "<p>Текст</p>"})
+        other = self.make_cache()
+        self.assertEqual(other.get("page"), {"html": "<p>Текст</p>"})
+        other.delete("page")
+        self.assertIsNone(self.cache.get("page"))
+
+    def test_expired_entries_are_not_returned(self):
+        """Просроченные записи не читаются и освобождают ключ для add."""
+        self.cache.set("page", "old", timeout=0.05)
+        time.sleep(0.1)
+        self.assertIsNone(self.cache.get("page"))
+        self.assertTrue(self.cache.add("page", "new"))
+        self.assertFalse(self.cache.add("page", "newer"))
+        self.assertEqual(self.cache.get("page"), "new")
+
+    def test_incr(self):
+        """incr атомарно меняет число, видимое всем экземплярам."""
+        self.cache.set("counter", 1)
+        self.assertEqual(self.cache.incr("counter", 2), 3)
+        self.assertEqual(self.make_cache().get("counter"), 3)
+        with self.assertRaises(ValueError):
+            self.cache.incr("missing")
+
+    def test_least_recently_used_entries_are_evicted(self):
+        """При переполнении вытесняются давно не читанные записи."""
+        cache = self.make_cache(MAX_ENTRIES=3, CULL_FREQUENCY=4)
+        for key in ("a", "b", "c"):
+            cache.set(key, key)
+            time.sleep(0.01)
+        cache._touch_accessed([cache.make_key("a")], time.time())
+        cache.set("d", "d")
+        self.assertEqual(
+            cache.get_many(["a", "b", "c", "d"]),
+            {"a": "a", "c": "c", "d": "d"})
+
+    def test_size_limit(self):
+        """Суммарный размер значений не превышает MAX_SIZE."""
+        cache = self.make_cache(MAX_SIZE=5000)
+        for i in range(10):
+            cache.set(i, "x" * 1000)
+        entries, size = cache._connection.execute(
+            "SELECT entries, size FROM cache_stats").fetchone()
+        self.assertLessEqual(size, 5000)
+        self.assertEqual(len(cache.get_many(range(10))), entries)
+
+    def test_overwrites_keep_counters_exact(self):
+        """Перезапись ключей не сдвигает счётчики и не вытесняет записи."""
+        cache = self.make_cache(MAX_ENTRIES=100)
+        data = {f"key{i}": "x" * i for i in range(50)}
+        for _ in range(3):
+            cache.set_many(data)
+            cache.set("key0", "перезапись")
+        self.assertFalse(cache.add("key1", "новое"))
+        self.assertEqual(len(cache.get_many(data)), len(data))
+        self.assertEqual(
+            cache._connection.execute(
+                "SELECT entries, size FROM cache_stats").fetchone(),
+            cache._connection.execute(
+                "SELECT COUNT(*), SUM(size) FROM cache").fetchone())
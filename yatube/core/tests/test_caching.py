@@ -0,0 +1,150 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+
+from core import caching
+
+KEY = "single-flight"
+WORKERS = 8
+
+
+class SingleFlightTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def compute(self):
+        with self.lock:
+            self.calls += 1
+            calls = self.calls
+        # Достаточно долго, чтобы все потоки промахнулись одновременно.
+        time.sleep(0.2)
+        return f"значение {calls}"
+
+    def stampede(self):
+        barrier = threading.Barrier(WORKERS)
+
+        def request(_):
+            barrier.wait()
+            return caching.get_or_set(KEY, self.compute, 60)
+
+        with ThreadPoolExecutor(WORKERS) as executor:
+            return list(executor.map(request, range(WORKERS)))
+
+    def test_value_is_computed_once_per_expiry(self):
+        """Одновременные промахи пула потоков вычисляют значение раз."""
+        for expiry in (1, 2):
+            with self.subTest(expiry=expiry):
+                self.assertEqual(
+                    self.stampede(), [f"значение {expiry}"] * WORKERS)
+                self.assertEqual(self.calls, expiry)
+                # Истечение записи.
+                cache.delete(KEY)
+
+    def test_waits_for_another_process(self):
+        """Пока другой процесс держит блокировку, его значение ждут."""
+        cache.add(caching.LOCK_PREFIX + KEY, 1)
+        threading.Timer(0.1, cache.set, [KEY, "чужое значение"]).start()
+        self.assertEqual(
+            caching.get_or_set(KEY, self.compute, 60), "чужое значение")
+        self.assertEqual(self.calls, 0)
+
+    @override_settings(SINGLE_FLIGHT_WAIT=0.1)
+    def test_stuck_lock_holder_is_not_waited_for_long(self):
+        """Зависший владелец блокировки задерживает запрос ненадолго."""
+        cache.add(caching.LOCK_PREFIX + KEY, 1)
+        self.assertEqual(
+            caching.get_or_set(KEY, self.compute, 60), "значение 1")
+
+    @override_settings(SINGLE_FLIGHT_WAIT=0.1)
+    def test_uncached_value_is_unwrapped_after_slow_leader(self):
+        """Не дождавшись первого потока, второй отдаёт своё значение."""
+        def compute():
+            time.sleep(0.3)
+            return caching.Uncached("заглушка")
+
+        with ThreadPoolExecutor(2) as executor:
+            values = list(executor.map(
+                lambda _: caching.get_or_refresh(
+                    KEY, compute, 60, 0, "test", 0),
+                range(2)))
+        self.assertEqual(values, ["заглушка"] * 2)
+        self.assertIsNone(cache.get(KEY))
+
+    def test_failed_computation_is_retried(self):
+        """Ошибка первого потока не оставляет остальных без значения."""
+        def fail():
+            time.sleep(0.1)
+            raise ValueError
+
+        with ThreadPoolExecutor(2) as executor:
+            failed = executor.submit(caching.get_or_set, KEY, fail, 60)
+            time.sleep(0.05)
+            retried = executor.submit(
+                caching.get_or_set, KEY, self.compute, 60)
+            with self.assertRaises(ValueError):
+                failed.result()
+            self.assertEqual(retried.result(), "значение 1")
+
+
+# Фоновое обновление отключается на базе SQLite в памяти, а этим тестам
+# база не нужна.
+@mock.patch.object(caching, "in_background", return_value=True)
+class StaleWhileRevalidateTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+        self.lock = threading.Lock()
+        self.release = threading.Event()
+        cache.set(KEY, ("старое", time.time() - 1), 60)
+
+    def compute(self):
+        with self.lock:
+            self.calls += 1
+        self.release.wait(5)
+        return "новое"
+
+    def get(self, workers=1):
+        return caching.get_or_refresh(
+            KEY, self.compute, 60, 30, "test", workers)
+
+    def wait_for_refresh(self):
+        deadline = time.monotonic() + 5
+        while cache.get(KEY)[0] != "новое":
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+    def test_stale_value_is_served_while_refreshing(self, in_background):
+        """Устаревшее значение отдаётся сразу, новое считает фон."""
+        self.assertEqual(self.get(), "старое")
+        self.release.set()
+        self.wait_for_refresh()
+        self.assertEqual(self.get(), "новое")
+        self.assertEqual(self.calls, 1)
+
+    def test_value_is_refreshed_once(self, in_background):
+        """Одновременные чтения устаревшего значения обновляют его раз."""
+        with ThreadPoolExecutor(WORKERS) as executor:
+            values = list(executor.map(
+                lambda _: self.get(), range(WORKERS)))
+        self.assertEqual(values, ["старое"] * WORKERS)
+        self.release.set()
+        self.wait_for_refresh()
+        self.assertEqual(self.calls, 1)
+
+    def test_without_workers_value_is_refreshed_in_request(
+            self, in_background):
+        """Без фоновых потоков устаревшее значение считается в запросе."""
+        self.release.set()
+        self.assertEqual(self.get(workers=0), "новое")
+
+    def test_missing_value_is_computed_in_request(self, in_background):
+        """После срока отсрочки значение считается в запросе."""
+        cache.delete(KEY)
+        self.release.set()
+        self.assertEqual(self.get(), "новое")
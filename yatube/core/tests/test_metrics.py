@@ -0,0 +1,80 @@
+from django.core.cache import cache
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from core import metrics
+from core.object_cache import ObjectCache
+from posts.models import Post, User
+
+METRICS_URL = reverse("metrics")
+INDEX_URL = reverse("posts:index")
+
+
+class HistogramTest(SimpleTestCase):
+    def test_buckets_are_cumulative(self):
+        """Корзины накопительные, значение на границе входит в корзину."""
+        histogram = metrics.Histogram("latency", "Время.", ("view",), (1, 2))
+        for value in (0.5, 1, 1.5, 3):
+            histogram.observe(("index",), value)
+        self.assertEqual(list(histogram.samples()), [
+            ("latency_bucket", 'view="index",le="1"', 2),
+            ("latency_bucket", 'view="index",le="2"', 3),
+            ("latency_bucket", 'view="index",le="+Inf"', 4),
+            ("latency_sum", 'view="index"', 6.0),
+            ("latency_count", 'view="index"', 4),
+        ])
+
+    def test_label_values_are_escaped(self):
+        self.assertEqual(
+            metrics.format_labels(("view",), ['a"b\\c']),
+            r'view="a\"b\\c"')
+
+
+class MetricsMiddlewareTest(TestCase):
+    def setUp(self):
+        metrics.reset()
+        cache.clear()
+        ObjectCache.clear_local()
+        author = User.objects.create_user(username="author")
+        Post.objects.create(author=author, text="Текст поста")
+        self.staff = Client()
+        self.staff.force_login(
+            User.objects.create_user(username="staff", is_staff=True))
+
+    def exposed(self):
+        response = self.staff.get(METRICS_URL)
+        self.assertEqual(response["Content-Type"], metrics.CONTENT_TYPE)
+        return response.content.decode()
+
+    @staticmethod
+    def sample(text, name, view="posts:index"):
+        prefix = f'{name}{{view="{view}"}} '
+        for line in text.splitlines():
+            if line.startswith(prefix):
+                return float(line[len(prefix):])
+
+    @override_settings(METRICS_ENABLED=True)
+    def test_request_metrics_are_exposed_per_view(self):
+        """Время, SQL, кеш и шаблоны учитываются по имени представления."""
+        Client().get(INDEX_URL)
+        text = self.exposed()
+        self.assertIn(
+            'yatube_request_duration_seconds_count{view="posts:index"} 1',
+            text)
+        self.assertIn(
+            'yatube_responses_total{view="posts:index",status="2xx"} 1',
+            text)
+        self.assertIn(
+            'yatube_cache_requests_total{view="posts:index",result="miss"}',
+            text)
+        for name in ("yatube_db_queries_sum",
+                     "yatube_template_duration_seconds_sum"):
+            self.assertGreater(self.sample(text, name), 0)
+
+    def test_metrics_are_off_by_default(self):
+        Client().get(INDEX_URL)
+        self.assertNotIn('view="posts:index"', self.exposed())
+
+    def test_metrics_are_for_staff_only(self):
+        response = Client().get(METRICS_URL)
+        self.assertEqual(response.status_code, 302)
@@ -0,0 +1,105 @@
+from django.core.cache import cache
+from django.test import Client, SimpleTestCase, TestCase
+from django.urls import reverse
+
+from core.object_cache import LocalCache, ObjectCache
+from posts import object_caches
+from posts.models import Group, Post, User
+
+SLUG = "slug"
+USERNAME = "author"
+
+
+class ObjectCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username=USERNAME)
+        cls.group = Group.objects.create(title="Группа", slug=SLUG)
+        cls.post = Post.objects.create(
+            author=cls.user, text="Текст", group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+        ObjectCache.clear_local()
+
+    def test_object_is_read_once(self):
+        """Повторный поиск не обращается к базе, даже без памяти процесса."""
+        object_caches.groups.get(slug=SLUG)
+        object_caches.groups.local.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(object_caches.groups.get(slug=SLUG), self.group)
+
+    def test_related_objects_come_from_their_caches(self):
+        """Автор и группа поста подставляются из своих кешей."""
+        object_caches.posts.get(pk=self.post.pk)
+        object_caches.posts.local.clear()
+        with self.assertNumQueries(0):
+            post = object_caches.posts.get(pk=self.post.pk)
+            self.assertEqual(post.author.username, USERNAME)
+            self.assertEqual(post.group.slug, SLUG)
+
+    def test_deferred_fields_are_not_cached(self):
+        """Хеш пароля не попадает в кеш, даже если автор прочитан с постом."""
+        object_caches.posts.get(pk=self.post.pk)
+        for key in object_caches.users.keys(self.user):
+            with self.subTest(key=key):
+                self.assertNotIn(
+                    self.user.password.encode(), cache.get(key))
+        user = object_caches.users.get(username=USERNAME)
+        self.assertEqual(user.get_deferred_fields(), {"password"})
+
+    def test_cached_objects_are_copies(self):
+        """Правка полученного объекта не меняет кеш."""
+        object_caches.users.get(username=USERNAME).first_name = "Лев"
+        self.assertEqual(
+            object_caches.users.get(username=USERNAME).first_name, "")
+
+    def test_missing_objects_are_cached(self):
+        """Отсутствие объекта запоминается до его создания."""
+        for queries in (1, 0):
+            with self.assertNumQueries(queries):
+                with self.assertRaises(Group.DoesNotExist):
+                    object_caches.groups.get(slug="missing")
+        Group.objects.create(title="Новая", slug="missing")
+        self.assertEqual(
+            object_caches.groups.get(slug="missing").title, "Новая")
+
+    def test_save_and_delete_invalidate(self):
+        """Переименование и удаление сбрасывают записи по всем ключам."""
+        object_caches.users.get(username=USERNAME)
+        object_caches.users.get(pk=self.user.pk)
+        # Копии, чтобы не менять общие для тестов объекты.
+        user = User.objects.get(pk=self.user.pk)
+        user.username = "renamed"
+        user.save()
+        with self.assertRaises(User.DoesNotExist):
+            object_caches.users.get(username=USERNAME)
+        self.assertEqual(
+            object_caches.users.get(pk=self.user.pk).username, "renamed")
+        Group.objects.get(pk=self.group.pk).delete()
+        with self.assertRaises(Group.DoesNotExist):
+            object_caches.groups.get(slug=SLUG)
+
+    def test_missing_page_hits_database_once(self):
+        """Перебор несуществующих адресов не доходит до базы."""
+        client = Client()
+        url = reverse("posts:group_list", args=["missing"])
+        self.assertEqual(client.get(url).status_code, 404)
+        with self.assertNumQueries(0):
+            self.assertEqual(client.get(url).status_code, 404)
+
+
+class LocalCacheTest(SimpleTestCase):
+    def test_least_recently_used_is_evicted(self):
+        local = LocalCache(2)
+        local.set("a", 1, 60)
+        local.set("b", 2, 60)
+        local.get("a")
+        local.set("c", 3, 60)
+        self.assertEqual(
+            [local.get(key) for key in "abc"], [1, None, 3])
+
+    def test_entries_expire(self):
+        local = LocalCache(2)
+        local.set("a", 1, -1)
+        self.assertIsNone(local.get("a"))
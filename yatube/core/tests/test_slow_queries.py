@@ -0,0 +1,45 @@
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from core import slow_queries
+from posts.models import Post, User
+
+INDEX_URL = reverse("posts:index")
+SLOW_QUERIES_URL = reverse("slow_queries")
+
+
+class SlowQueryMiddlewareTest(TestCase):
+    def setUp(self):
+        slow_queries.clear()
+        author = User.objects.create_user(username="author")
+        Post.objects.create(author=author, text="Текст поста")
+
+    @override_settings(SLOW_QUERY_THRESHOLD=0, SLOW_QUERY_EXPLAIN_RATE=1)
+    def test_slow_queries_are_recorded_with_plan(self):
+        """Запрос попадает в журнал с представлением, местом и планом."""
+        Client().get(INDEX_URL)
+        entries = slow_queries.entries()
+        self.assertTrue(entries)
+        selects = [
+            entry for entry in entries if entry["sql"].startswith("SELECT")]
+        self.assertTrue(selects)
+        for entry in selects:
+            self.assertEqual(entry["view"], "posts:index")
+            self.assertTrue(entry["plan"])
+            self.assertRegex(entry["site"], r"^posts/\w+\.py:\d+ in \w+$")
+
+    @override_settings(SLOW_QUERY_THRESHOLD=60)
+    def test_fast_queries_are_not_recorded(self):
+        Client().get(INDEX_URL)
+        self.assertEqual(slow_queries.entries(), [])
+
+    @override_settings(SLOW_QUERY_THRESHOLD=0, SLOW_QUERY_EXPLAIN_RATE=0)
+    def test_journal_is_for_staff_only(self):
+        Client().get(INDEX_URL)
+        staff = Client()
+        staff.force_login(
+            User.objects.create_user(username="staff", is_staff=True))
+        self.assertEqual(Client().get(SLOW_QUERIES_URL).status_code, 302)
+        entries = staff.get(SLOW_QUERIES_URL).json()["entries"]
+        self.assertTrue(entries)
+        self.assertIsNone(entries[-1]["plan"])
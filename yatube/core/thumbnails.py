@@ -0,0 +1,106 @@
+"""Генерация превью картинок вне обработки запроса.
+
+Шаблоны спрашивают у sorl-thumbnail только готовое превью из хранилища
+ключей, а недостающее ставят в очередь: его отрисует пул фоновых потоков,
+и следующий запрос страницы получит готовую ссылку.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_pending = set()
+_lock = threading.Lock()
+
+
+class QueuedThumbnailBackend(ThumbnailBackend):
+    def get_options(self, source, options):
+        """Дополнить опции так же, как это делает get_thumbnail."""
+        options = dict(options)
+        if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault("format", self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(thumbnail_settings, attr)
+            if value != getattr(default_settings, attr):
+                options.setdefault(key, value)
+        return options
+
+    def get_ready_thumbnail(self, file_, geometry_string, **options):
+        """Готовое превью из хранилища ключей или None, без Pillow."""
+        source = ImageFile(file_)
+        name = self._get_thumbnail_filename(
+            source, geometry_string, self.get_options(source, options))
+        return default.kvstore.get(ImageFile(name, default.storage))
+
+
+backend = QueuedThumbnailBackend()
+
+
+def get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix="thumbnails")
+        return _executor
+
+
+def render(key, file_, geometry_string, options):
+    try:
+        default.backend.get_thumbnail(file_, geometry_string, **options)
+    except Exception:
+        logger.exception("Не удалось создать превью %s", file_)
+    finally:
+        with _lock:
+            _pending.discard(key)
+
+
+def render_in_worker(*args):
+    try:
+        render(*args)
+    finally:
+        # Соединения с базой в потоках пула открываются хранилищем ключей
+        # и без закрытия остались бы висеть до конца процесса.
+        connections.close_all()
+
+
+def schedule(file_, geometry_string, **options):
+    """Поставить превью в очередь; повторные заявки не дублируются."""
+    key = (file_.name, geometry_string, tuple(sorted(options.items())))
+    with _lock:
+        if key in _pending:
+            return
+        _pending.add(key)
+    # Потоки с базой SQLite в памяти делят её с блокировкой целых таблиц
+    # и мешают основному потоку, поэтому там превью рисуется сразу.
+    if not settings.THUMBNAIL_WORKERS or (
+            connections["default"].vendor == "sqlite"
+            and connections["default"].is_in_memory_db()):
+        render(key, file_, geometry_string, options)
+        return
+    get_executor().submit(
+        render_in_worker, key, file_, geometry_string, options)
+
+
+def get_or_schedule(file_, geometry_string, **options):
+    """Вернуть готовое превью, а отсутствующее заказать в фоне."""
+    if not file_:
+        return None
+    thumbnail = backend.get_ready_thumbnail(
+        file_, geometry_string, **options)
+    if thumbnail is None:
+        schedule(file_, geometry_string, **options)
+    return thumbnail
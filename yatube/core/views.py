@@ -1,5 +1,9 @@
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponse, JsonResponse
 from django.shortcuts import render
 
+from core import metrics, slow_queries
+
 
 def page_not_found(request, exception):
     return render(request, "core/404.html", {"path": request.path}, status=404)
@@ -15,3 +19,15 @@ def server_error(request):
 
 def permission_denied(request, exception):
     return render(request, 'core/403.html', status=403)
+
+
+@staff_member_required
+def metrics_view(request):
+    return HttpResponse(metrics.expose(), content_type=metrics.CONTENT_TYPE)
+
+
+@staff_member_required
+def slow_queries_view(request):
+    return JsonResponse(
+        {"entries": slow_queries.entries()},
+        json_dumps_params={"ensure_ascii": False, "indent": 2})
@@ -10,6 +10,12 @@ class PostAdmin(admin.ModelAdmin):
     empty_value_display = "-пусто-"
     list_editable = ("group",)
 
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск по полнотекстовому индексу вместо LIKE по всем постам."""
+        if not search_term:
+            return queryset, False
+        return queryset.search(search_term), False
+
 
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group)
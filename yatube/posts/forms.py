@@ -1,6 +1,7 @@
 from django import forms
 
-from .models import Comment, Post
+from .export import FORMATS
+from .models import Comment, Group, Post
 
 
 class PostForm(forms.ModelForm):
@@ -23,3 +24,25 @@ class CommentForm(forms.ModelForm):
     class Meta:
         model = Comment
         fields = ("text",)
+
+
+class SearchForm(forms.Form):
+    q = forms.CharField(label="Поиск", max_length=200)
+    group = forms.ModelChoiceField(
+        Group.objects.all(),
+        to_field_name="slug",
+        required=False,
+        label="Группа",
+        empty_label="Все группы",
+    )
+    author = forms.CharField(label="Автор", max_length=150, required=False)
+
+
+class ExportForm(forms.Form):
+    format = forms.ChoiceField(
+        choices=[(name, name) for name in FORMATS], required=False)
+    since = forms.DateTimeField(required=False)
+    until = forms.DateTimeField(required=False)
+    group = forms.SlugField(required=False)
+    author = forms.CharField(max_length=150, required=False)
+    after = forms.IntegerField(min_value=0, required=False)
@@ -0,0 +1,275 @@
+"""Массовая загрузка постов, комментариев и подписок.
+
+Строки читаются потоком в формате выгрузки (posts.export), авторы
+и группы находятся по словарям в памяти, а записи создаются через
+bulk_create порциями, каждая в своей транзакции. Сигналы на каждую
+строку не срабатывают, поэтому то, что они поддерживают (статистика
+пользователей, ленты подписок, поколения кеша), после загрузки
+восстанавливается для затронутых пользователей разом.
+"""
+import csv
+import json
+import os
+from collections import defaultdict
+from contextlib import contextmanager
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from core import caching
+from . import object_caches
+from .models import Comment, FeedEntry, Follow, Group, Post, User, UserStats
+
+
+def read_rows(file, format):
+    """Строки файла выгрузки как словари; пустые значения CSV — None."""
+    if format == "jsonl":
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+        return
+    for row in csv.DictReader(file):
+        yield {key: value or None for key, value in row.items()}
+
+
+def batches(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+@contextmanager
+def explicit_dates(*fields):
+    """Не заменять даты из файла текущим временем (auto_now_add)."""
+    saved = [field.auto_now_add for field in fields]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now_add in zip(fields, saved):
+            field.auto_now_add = auto_now_add
+
+
+class Importer:
+    """Загрузка строк одной таблицы; id из файла сохраняются, если есть."""
+    model = None
+    date_field = None
+    ignore_conflicts = False
+    # Меняет ли таблица ленты подписок (посты и подписки — да).
+    fills_feeds = True
+    # Кеш объектов таблицы, где адреса новых записей могли запомниться
+    # как отсутствующие.
+    object_cache = None
+
+    def __init__(self, batch_size=1000):
+        self.batch_size = batch_size
+        self.users = {}
+        self.touched_users = set()
+        self.touched_scopes = {"posts", "users", "groups"}
+        self.now = timezone.now()
+
+    def user_ids(self, usernames):
+        """id пользователей по именам; недостающие создаются."""
+        missing = set(usernames) - set(self.users) - {None}
+        if missing:
+            self.users.update(User.objects.filter(
+                username__in=missing).values_list("username", "pk"))
+            new = missing - set(self.users)
+            if new:
+                # SQLite не возвращает id из bulk_create: перечитываем.
+                User.objects.bulk_create(
+                    User(username=username, password=make_password(None))
+                    for username in new)
+                self.users.update(User.objects.filter(
+                    username__in=new).values_list("username", "pk"))
+                # Профили этих имён могли запомниться как отсутствующие.
+                object_caches.users.forget("username", new)
+        return self.users
+
+    def date(self, value):
+        if value is None:
+            return self.now
+        value = self.model._meta.get_field(self.date_field).to_python(value)
+        if settings.USE_TZ and timezone.is_naive(value):
+            return timezone.make_aware(value)
+        if not settings.USE_TZ and timezone.is_aware(value):
+            return timezone.make_naive(value)
+        return value
+
+    def run(self, rows):
+        """Загрузить строки; после каждой порции отдаётся её размер."""
+        fields = [
+            self.model._meta.get_field(self.date_field)
+        ] if self.date_field else []
+        with explicit_dates(*fields):
+            for batch in batches(rows, self.batch_size):
+                last_pk = self.last_pk()
+                with transaction.atomic():
+                    # Размер одного INSERT Django подбирает под лимиты базы.
+                    created = self.model.objects.bulk_create(
+                        self.build(batch),
+                        ignore_conflicts=self.ignore_conflicts)
+                self.forget_created(created, last_pk)
+                yield len(batch)
+        self.finish()
+
+    def last_pk(self):
+        if self.object_cache is None:
+            return None
+        return self.model.objects.aggregate(last=Max("pk"))["last"] or 0
+
+    def forget_created(self, created, last_pk):
+        """Сбросить в кеше объектов записи об отсутствии новых записей."""
+        if self.object_cache is None:
+            return
+        # id из файла известны, а выданные базой SQLite не возвращает
+        # из bulk_create: это все id больше прежнего наибольшего.
+        pks = {obj.pk for obj in created if obj.pk is not None}
+        pks.update(self.model.objects.filter(pk__gt=last_pk).values_list(
+            "pk", flat=True))
+        self.object_cache.forget("pk", pks)
+
+    def build(self, batch):
+        raise NotImplementedError
+
+    def finish(self):
+        """Восстановить данные, которые поддерживают сигналы."""
+        user_ids = sorted(self.touched_users)
+        for start in range(0, len(user_ids), self.batch_size):
+            batch = user_ids[start:start + self.batch_size]
+            with transaction.atomic():
+                UserStats.objects.rebuild(*batch)
+                if not self.fills_feeds:
+                    continue
+                # Ленты подписчиков затронутых авторов дозаполняются
+                # последними постами авторов, как при новой подписке.
+                popular = set(UserStats.objects.filter(
+                    user_id__in=batch, fanned_out=False,
+                ).values_list("user_id", flat=True))
+                followers = defaultdict(list)
+                for user_id, author_id in Follow.objects.filter(
+                    author_id__in=batch,
+                ).exclude(
+                    author_id__in=popular,
+                ).values_list("user_id", "author_id").iterator():
+                    followers[author_id].append(user_id)
+                for author_id, follower_ids in followers.items():
+                    FeedEntry.objects.backfill_many(follower_ids, author_id)
+        caching.bump(*self.touched_scopes)
+
+
+class PostImporter(Importer):
+    model = Post
+    date_field = "pub_date"
+    object_cache = object_caches.posts
+
+    def __init__(self, batch_size=1000, images_from=None):
+        super().__init__(batch_size)
+        self.images_from = images_from
+        self.groups = dict(Group.objects.values_list("slug", "pk"))
+        self.missing_images = 0
+
+    def group_id(self, slug):
+        if slug is None:
+            return None
+        if slug not in self.groups:
+            self.groups[slug] = Group.objects.get_or_create(
+                slug=slug, defaults={"title": slug})[0].pk
+        return self.groups[slug]
+
+    def image(self, name):
+        """Путь картинки в хранилище; недоступная картинка отбрасывается."""
+        if not name:
+            return ""
+        if self.images_from and not default_storage.exists(name):
+            source = os.path.join(self.images_from, name)
+            if os.path.exists(source):
+                with open(source, "rb") as file:
+                    name = default_storage.save(name, File(file))
+        if not default_storage.exists(name):
+            self.missing_images += 1
+            return ""
+        return name
+
+    def build(self, batch):
+        users = self.user_ids(row["author__username"] for row in batch)
+        self.touched_users.update(
+            users[row["author__username"]] for row in batch)
+        posts = [
+            Post(
+                id=row.get("id"),
+                text=row["text"],
+                pub_date=self.date(row.get("pub_date")),
+                author_id=users[row["author__username"]],
+                group_id=self.group_id(row.get("group__slug")),
+                image=self.image(row.get("image")),
+            )
+            for row in batch
+        ]
+        # bulk_create не вызывает save(), HTML текста рисуется здесь.
+        for post in posts:
+            post.render_text()
+        return posts
+
+
+class CommentImporter(Importer):
+    model = Comment
+    date_field = "created"
+    fills_feeds = False
+
+    def build(self, batch):
+        users = self.user_ids(row["author__username"] for row in batch)
+        self.touched_users.update(
+            users[row["author__username"]] for row in batch)
+        self.touched_scopes.update(f"post:{row['post_id']}" for row in batch)
+        return [
+            Comment(
+                id=row.get("id"),
+                post_id=row["post_id"],
+                author_id=users[row["author__username"]],
+                text=row["text"] or "",
+                created=self.date(row.get("created")),
+            )
+            for row in batch
+        ]
+
+
+class FollowImporter(Importer):
+    model = Follow
+    ignore_conflicts = True
+
+    def build(self, batch):
+        users = self.user_ids(
+            username
+            for row in batch
+            for username in (row["user__username"], row["author__username"])
+        )
+        follows = [
+            Follow(
+                id=row.get("id"),
+                user_id=users[row["user__username"]],
+                author_id=users[row["author__username"]],
+            )
+            for row in batch
+            if row["user__username"] != row["author__username"]
+        ]
+        for follow in follows:
+            self.touched_users.update((follow.user_id, follow.author_id))
+        return follows
+
+
+IMPORTERS = {
+    "posts": PostImporter,
+    "comments": CommentImporter,
+    "follows": FollowImporter,
+}
@@ -0,0 +1,152 @@
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.utils import timezone
+
+from posts.models import FeedEntry, Follow, Group, Post, User, UserStats
+from posts.paginators import KeysetPaginator
+
+ALIAS = "bench_feed_queries"
+
+
+class Command(BaseCommand):
+    help = (
+        "Заполняет временную базу SQLite постами и сравнивает планы "
+        "и задержку запросов лент без составных индексов и с ними.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--posts", type=int, default=1_000_000)
+        parser.add_argument("--authors", type=int, default=10_000)
+        parser.add_argument("--groups", type=int, default=100)
+        parser.add_argument(
+            "--following", type=int, default=200,
+            help="На скольких авторов подписан читатель ленты подписок.")
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            connections.databases[ALIAS] = {
+                **settings.DATABASES["default"],
+                "NAME": os.path.join(directory, "bench.sqlite3"),
+            }
+            try:
+                self.run(connections[ALIAS], **options)
+            finally:
+                connections[ALIAS].close()
+                del connections.databases[ALIAS]
+
+    def run(self, connection, posts, authors, groups, following, repeat,
+            seed, **options):
+        with connection.schema_editor() as editor:
+            for model in (User, Group, Post, Follow, UserStats, FeedEntry):
+                editor.create_model(model)
+        self.stdout.write(f"Заполняю базу: {posts} постов...")
+        picks = random.Random(seed)
+        with transaction.atomic(using=ALIAS):
+            self.seed(connection, picks, posts, authors, groups, following)
+        queries = self.queries(picks, authors, groups)
+        indexes = [
+            (model, index)
+            for model in (Post, Follow)
+            for index in model._meta.indexes
+        ]
+        with connection.schema_editor() as editor:
+            for model, index in indexes:
+                editor.remove_index(model, index)
+        self.report(connection, "без индексов", queries, repeat)
+        with connection.schema_editor() as editor:
+            for model, index in indexes:
+                editor.add_index(model, index)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        self.report(connection, "с индексами", queries, repeat)
+
+    def seed(self, connection, picks, posts, authors, groups, following):
+        User.objects.using(ALIAS).bulk_create(
+            (User(username=f"author{i}") for i in range(authors + 1)),
+            batch_size=settings.FEED_BATCH_SIZE)
+        Group.objects.using(ALIAS).bulk_create(
+            (
+                Group(title=f"Группа {i}", slug=f"group{i}")
+                for i in range(groups)
+            ),
+            batch_size=settings.FEED_BATCH_SIZE)
+        now = timezone.now()
+        year = 365 * 24 * 60 * 60
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                "INSERT INTO %s (text, text_html, text_preview, pub_date,"
+                " image, author_id, group_id)"
+                " VALUES (%%s, '', '', %%s, '', %%s, %%s)"
+                % Post._meta.db_table,
+                (
+                    (
+                        f"Текст {i}",
+                        now - timedelta(seconds=picks.randrange(year)),
+                        picks.randint(1, authors),
+                        picks.randint(1, groups) if i % 3 else None,
+                    )
+                    for i in range(posts)
+                ))
+        # Последний пользователь — читатель ленты подписок, у каждого
+        # автора тоже есть подписчики.
+        reader_id = authors + 1
+        follows = {
+            (reader_id, author_id)
+            for author_id in picks.sample(range(1, authors + 1), following)
+        }
+        follows.update(
+            (picks.randint(1, authors), picks.randint(1, authors))
+            for _ in range(authors * 10))
+        Follow.objects.using(ALIAS).bulk_create(
+            (
+                Follow(user_id=user_id, author_id=author_id)
+                for user_id, author_id in follows
+            ),
+            batch_size=settings.FEED_BATCH_SIZE,
+            ignore_conflicts=True)
+
+    def queries(self, picks, authors, groups):
+        posts = Post.objects.using(ALIAS).for_feed()
+        paginator = KeysetPaginator(posts, settings.POSTS_ON_PAGE)
+        middle = paginator.object_list[posts.count() // 2:][:1].get()
+        return {
+            "index": posts,
+            "index, глубокая страница": paginator.object_list.filter(
+                paginator._seek([middle.pub_date, middle.id])),
+            "group": posts.filter(group_id=picks.randint(1, groups)),
+            "profile": posts.filter(author_id=picks.randint(1, authors)),
+            "follow": posts.filter(author__in=Follow.objects.filter(
+                user_id=authors + 1).values("author")),
+            "подписчики автора": Follow.objects.using(ALIAS).filter(
+                author_id=picks.randint(1, authors)).values_list(
+                    "user_id", flat=True),
+        }
+
+    def report(self, connection, title, queries, repeat):
+        self.stdout.write(self.style.MIGRATE_HEADING(title))
+        with connection.cursor() as cursor:
+            for name, queryset in queries.items():
+                query = queryset[:settings.POSTS_ON_PAGE].query
+                sql, params = query.get_compiler(using=ALIAS).as_sql()
+                cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+                plan = [row[-1] for row in cursor.fetchall()]
+                timings = []
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    cursor.execute(sql, params)
+                    cursor.fetchall()
+                    timings.append((time.perf_counter() - started) * 1e3)
+                self.stdout.write(
+                    f"{name}: медиана {statistics.median(timings):.2f} мс, "
+                    f"максимум {max(timings):.2f} мс")
+                for step in plan:
+                    self.stdout.write(f"    {step}")
@@ -0,0 +1,37 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+from django.template.loader import get_template
+
+from posts.paginators import WindowedPaginator
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает размер и время отрисовки пагинатора со ссылкой "
+        "на каждую страницу и с укороченным списком страниц.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--posts", type=int, default=50_000)
+        parser.add_argument("--repeat", type=int, default=50)
+
+    def handle(self, *args, posts, repeat, **options):
+        template = get_template("posts/includes/paginator.html")
+        number = posts // settings.POSTS_ON_PAGE // 2
+        for name, paginator_class in [
+            ["все страницы", Paginator],
+            ["окно", WindowedPaginator],
+        ]:
+            page = paginator_class(
+                range(posts), settings.POSTS_ON_PAGE).get_page(number)
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                html = template.render({"page_obj": page})
+                timings.append((time.perf_counter() - started) * 1e3)
+            self.stdout.write(
+                f"{name:>12}: {len(html.encode()) / 1024:8.1f} КБ, "
+                f"медиана {statistics.median(timings):8.2f} мс")
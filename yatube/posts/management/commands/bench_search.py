@@ -0,0 +1,120 @@
+import itertools
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections, migrations, transaction
+from django.db.migrations.loader import MigrationLoader
+
+from posts.models import Group, Post, User
+
+ALIAS = "bench_search"
+SYLLABLES = "ка ро ми на ло те сы пу да ве жи бо ну ле фа ты".split()
+
+
+class Command(BaseCommand):
+    help = (
+        "Заполняет временную базу SQLite постами и сравнивает поиск "
+        "через LIKE с поиском по полнотекстовому индексу.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--posts", type=int, default=1_000_000)
+        parser.add_argument("--words", type=int, default=5_000)
+        parser.add_argument("--post-length", type=int, default=12)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            connections.databases[ALIAS] = {
+                **settings.DATABASES["default"],
+                "NAME": os.path.join(directory, "bench.sqlite3"),
+            }
+            try:
+                self.run(connections[ALIAS], **options)
+            finally:
+                connections[ALIAS].close()
+                del connections.databases[ALIAS]
+
+    def run(self, connection, posts, words, post_length, repeat, seed,
+            **options):
+        picks = random.Random(seed)
+        vocabulary = list(itertools.islice(
+            (
+                "".join(syllables)
+                for size in (2, 3, 4)
+                for syllables in itertools.product(SYLLABLES, repeat=size)
+            ),
+            words))
+        picks.shuffle(vocabulary)
+        # Частоты слов убывают по закону Ципфа, как в живом тексте.
+        weights = list(itertools.accumulate(
+            1 / rank for rank in range(1, words + 1)))
+        with connection.schema_editor() as editor:
+            for model in (User, Group, Post):
+                editor.create_model(model)
+        self.stdout.write(f"Заполняю базу: {posts} постов...")
+        with transaction.atomic(using=ALIAS):
+            author = User.objects.using(ALIAS).create(username="author")
+            with connection.cursor() as cursor:
+                cursor.executemany(
+                    "INSERT INTO %s (text, text_html, text_preview, "
+                    "pub_date, image, author_id) "
+                    "VALUES (%%s, '', '', datetime('now', %%s), '', %%s)"
+                    % Post._meta.db_table,
+                    (
+                        (
+                            " ".join(picks.choices(
+                                vocabulary,
+                                cum_weights=weights,
+                                k=post_length)),
+                            f"-{posts - i} minutes",
+                            author.pk,
+                        )
+                        for i in range(posts)
+                    ))
+        self.stdout.write("Строю полнотекстовый индекс...")
+        started = time.perf_counter()
+        self.create_search_index(connection)
+        self.stdout.write(
+            f"Индекс построен за {time.perf_counter() - started:.1f} с")
+        posts = Post.objects.using(ALIAS).for_feed()
+        for rank in (10, 300, words - 1):
+            word = vocabulary[rank - 1]
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"«{word}», {rank}-е по частоте слово"))
+            for name, queryset in [
+                ["LIKE", posts.filter(text__icontains=word)],
+                ["FTS5", posts.search(word)],
+            ]:
+                self.report(name, queryset, repeat)
+
+    def create_search_index(self, connection):
+        """Создать индекс той же миграцией, что и в рабочей базе."""
+        migration = MigrationLoader(connection).get_migration_by_prefix(
+            "posts", "0025")
+        with connection.schema_editor() as editor:
+            for operation in migration.operations:
+                if isinstance(operation, migrations.RunSQL):
+                    operation.database_forwards("posts", editor, None, None)
+
+    def report(self, name, queryset, repeat):
+        for title, run in [
+            ["первая страница", lambda: list(
+                queryset[:settings.POSTS_ON_PAGE])],
+            ["число найденных", queryset.count],
+        ]:
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                result = run()
+                timings.append((time.perf_counter() - started) * 1e3)
+            if isinstance(result, int):
+                title = f"{title} ({result})"
+            self.stdout.write(
+                f"{name}, {title}: медиана "
+                f"{statistics.median(timings):.2f} мс")
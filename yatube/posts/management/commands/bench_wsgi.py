@@ -0,0 +1,315 @@
+import io
+import json
+import math
+import random
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import urlencode
+from wsgiref.util import setup_testing_defaults
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.models import Max
+from django.test import Client
+from django.urls import reverse
+from django.utils.crypto import get_random_string
+
+from posts.models import Group, Post, User, UserStats
+
+DEFAULT_MIX = (
+    "index=30,group=15,profile=15,post_detail=20,follow_index=10,"
+    "post_create=5,add_comment=5")
+# Маршруты, которые без входа отвечают редиректом на логин.
+LOGIN_REQUIRED = {"follow_index", "post_create", "add_comment"}
+PERCENTILES = (50, 95, 99)
+
+
+def parse_mix(value):
+    """«маршрут=вес,...» в словарь весов."""
+    mix = {}
+    for item in value.split(","):
+        route, _, weight = item.partition("=")
+        mix[route.strip()] = float(weight)
+    return mix
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def run_requests(requests):
+    """Прогнать запросы через WSGI-приложение в текущем потоке.
+
+    Для каждого запроса возвращается маршрут, код ответа, время в мс
+    и число SQL-запросов.
+    """
+    from yatube.wsgi import application
+
+    results = []
+    for route, method, path, body, cookie in requests:
+        environ = {
+            "REQUEST_METHOD": method,
+            "PATH_INFO": path,
+            "wsgi.input": io.BytesIO(body),
+            "wsgi.errors": sys.stderr,
+        }
+        if body:
+            environ["CONTENT_TYPE"] = "application/x-www-form-urlencoded"
+            environ["CONTENT_LENGTH"] = str(len(body))
+        if cookie:
+            environ["HTTP_COOKIE"] = cookie["cookie"]
+            environ["HTTP_X_CSRFTOKEN"] = cookie["csrf"]
+        setup_testing_defaults(environ)
+        statuses = []
+        counter = QueryCounter()
+        started = time.perf_counter()
+        with connection.execute_wrapper(counter):
+            response = application(
+                environ,
+                lambda status, headers, exc_info=None: statuses.append(
+                    status))
+            try:
+                for _ in response:
+                    pass
+            finally:
+                response.close()
+        results.append((
+            route,
+            int(statuses[0].split()[0]),
+            (time.perf_counter() - started) * 1e3,
+            counter.count,
+        ))
+    return results
+
+
+def percentile(values, percent):
+    """Перцентиль по ближайшему рангу."""
+    values = sorted(values)
+    return values[max(0, math.ceil(len(values) * percent / 100) - 1)]
+
+
+def summarize(results, elapsed):
+    timings = [result[2] for result in results]
+    summary = {
+        "requests": len(results),
+        "errors": sum(result[1] >= 400 for result in results),
+        "rps": len(results) / elapsed,
+        "queries": sum(result[3] for result in results) / len(results),
+    }
+    for percent in PERCENTILES:
+        summary[f"p{percent}"] = percentile(timings, percent)
+    return summary
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный тест WSGI-приложения без сети и сервера: смесь "
+        "маршрутов от анонимов и вошедших пользователей из пула потоков "
+        "или процессов. Запросы на запись меняют базу, поэтому запускайте "
+        "его на копии, например заполненной через seed_load.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--warmup", type=int, default=100)
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument(
+            "--pool", choices=["thread", "process"], default="thread")
+        parser.add_argument(
+            "--mix", type=parse_mix, default=DEFAULT_MIX,
+            help=f"Веса маршрутов, по умолчанию {DEFAULT_MIX}.")
+        parser.add_argument(
+            "--logged-in", type=float, default=0.5,
+            help="Доля запросов от вошедших пользователей на маршрутах, "
+                 "открытых анонимам.")
+        parser.add_argument(
+            "--sessions", type=int, default=20,
+            help="Сколько пользователей входят для теста.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="Сохранить результаты в JSON.")
+        parser.add_argument(
+            "--baseline", help="JSON прошлого запуска для сравнения.")
+
+    def handle(self, *args, requests, warmup, workers, pool, mix,
+               logged_in, sessions, seed, output, baseline, **options):
+        if requests < 1:
+            raise CommandError("Нужен хотя бы один замеряемый запрос.")
+        if isinstance(mix, str):
+            mix = parse_mix(mix)
+        unknown = set(mix) - set(self.routes())
+        if unknown:
+            raise CommandError(
+                f"Неизвестные маршруты: {', '.join(sorted(unknown))}.")
+        picks = random.Random(seed)
+        targets = self.targets(picks)
+        cookies = self.sessions(picks, sessions)
+        plan = list(self.plan(
+            picks, mix, warmup + requests, logged_in, targets, cookies))
+        run_requests(plan[:warmup])
+        plan = plan[warmup:]
+        started = time.perf_counter()
+        results = self.run(plan, workers, pool)
+        elapsed = time.perf_counter() - started
+        by_route = defaultdict(list)
+        for result in results:
+            by_route[result[0]].append(result)
+        report = {
+            "options": {
+                "requests": requests,
+                "workers": workers,
+                "pool": pool,
+                "mix": mix,
+                "logged_in": logged_in,
+                "seed": seed,
+            },
+            "elapsed": elapsed,
+            "routes": {
+                route: summarize(route_results, elapsed)
+                for route, route_results in sorted(by_route.items())
+            },
+            "total": summarize(results, elapsed),
+        }
+        self.print(report, self.load(baseline) if baseline else None)
+        if output:
+            with open(output, "w", encoding="utf-8") as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+
+    def routes(self):
+        """Маршрут: метод, путь по целям теста и тело запроса."""
+        return {
+            "index": lambda targets, picks: (
+                "GET", reverse("posts:index"), None),
+            "group": lambda targets, picks: (
+                "GET",
+                reverse("posts:group_list",
+                        args=[picks.choice(targets["groups"])]),
+                None),
+            "profile": lambda targets, picks: (
+                "GET",
+                reverse("posts:profile",
+                        args=[picks.choice(targets["authors"])]),
+                None),
+            "post_detail": lambda targets, picks: (
+                "GET",
+                reverse("posts:post_detail",
+                        args=[picks.choice(targets["posts"])]),
+                None),
+            "follow_index": lambda targets, picks: (
+                "GET", reverse("posts:follow_index"), None),
+            "post_create": lambda targets, picks: (
+                "POST",
+                reverse("posts:post_create"),
+                {"text": f"Пост нагрузочного теста {picks.random()}"}),
+            "add_comment": lambda targets, picks: (
+                "POST",
+                reverse("posts:add_comment",
+                        args=[picks.choice(targets["posts"])]),
+                {"text": "Комментарий нагрузочного теста"}),
+        }
+
+    def targets(self, picks, size=100):
+        """Группы, авторы и посты, которые запрашивает тест."""
+        last = Post.objects.aggregate(last=Max("id"))["last"]
+        if last is None:
+            raise CommandError("В базе нет постов: заполните её seed_load.")
+        post_ids = list(Post.objects.filter(
+            pk__in=picks.sample(range(1, last + 1), min(last, size * 10)),
+        ).values_list("pk", flat=True)[:size])
+        slugs = list(Group.objects.values_list("slug", flat=True))
+        authors = list(UserStats.objects.filter(
+            posts_count__gt=0).values_list("user__username", flat=True))
+        return {
+            "posts": post_ids,
+            "groups": picks.sample(slugs, min(len(slugs), size)),
+            "authors": picks.sample(authors, min(len(authors), size)),
+        }
+
+    def sessions(self, picks, count):
+        """Куки сессий пользователей с подписками."""
+        readers = list(UserStats.objects.filter(
+            following_count__gt=0).values_list("user_id", flat=True))
+        if not readers:
+            readers = list(User.objects.values_list("pk", flat=True))
+        cookies = []
+        for user in User.objects.filter(
+                pk__in=picks.sample(readers, min(len(readers), count))):
+            client = Client()
+            client.force_login(user)
+            session = client.cookies[settings.SESSION_COOKIE_NAME].value
+            csrf = get_random_string(32)
+            cookies.append({
+                "cookie": (
+                    f"{settings.SESSION_COOKIE_NAME}={session}; "
+                    f"{settings.CSRF_COOKIE_NAME}={csrf}"),
+                "csrf": csrf,
+            })
+        return cookies
+
+    def plan(self, picks, mix, count, logged_in, targets, cookies):
+        routes = self.routes()
+        names = [name for name in mix if mix[name] > 0]
+        weights = [mix[name] for name in names]
+        for _ in range(count):
+            name = picks.choices(names, weights)[0]
+            method, path, data = routes[name](targets, picks)
+            cookie = None
+            if cookies and (
+                    name in LOGIN_REQUIRED or picks.random() < logged_in):
+                cookie = picks.choice(cookies)
+            body = urlencode(data).encode() if data else b""
+            yield name, method, path, body, cookie
+
+    def run(self, plan, workers, pool):
+        if workers <= 1:
+            return run_requests(plan)
+        if pool == "process":
+            # Дочерние процессы не должны делить открытые соединения.
+            connections.close_all()
+            executor = ProcessPoolExecutor(workers)
+        else:
+            executor = ThreadPoolExecutor(workers)
+        with executor:
+            chunks = executor.map(
+                run_requests, [plan[i::workers] for i in range(workers)])
+            return [result for chunk in chunks for result in chunk]
+
+    def load(self, path):
+        with open(path, encoding="utf-8") as file:
+            return json.load(file)
+
+    def print(self, report, baseline):
+        columns = ["requests", "errors", "rps", "queries"] + [
+            f"p{percent}" for percent in PERCENTILES]
+        self.stdout.write(
+            f"{'маршрут':<14}" + "".join(f"{name:>10}" for name in columns))
+        rows = list(report["routes"].items()) + [["всего", report["total"]]]
+        for route, summary in rows:
+            self.stdout.write(f"{route:<14}" + "".join(
+                f"{summary[name]:>10.1f}" if isinstance(summary[name], float)
+                else f"{summary[name]:>10}"
+                for name in columns))
+            if baseline is None:
+                continue
+            before = (
+                baseline["total"] if route == "всего"
+                else baseline["routes"].get(route))
+            if before:
+                self.stdout.write(f"{'  к базовому':<14}" + "".join(
+                    f"{self.change(before.get(name), summary[name]):>10}"
+                    for name in columns))
+        self.stdout.write(
+            f"Время в мс; {report['total']['requests']} запросов "
+            f"за {report['elapsed']:.1f} с.")
+
+    @staticmethod
+    def change(before, after):
+        if not before:
+            return "—"
+        return f"{(after - before) / before:+.0%}"
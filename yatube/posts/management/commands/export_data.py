@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.export import EXPORTS, FORMATS, render
+from posts.forms import ExportForm
+
+
+class Command(BaseCommand):
+    help = (
+        "Потоком выгружает посты, комментарии или подписки в JSONL или CSV. "
+        "Прерванную выгрузку можно продолжить с --after-id.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=list(EXPORTS))
+        parser.add_argument(
+            "--format", choices=list(FORMATS), default="jsonl")
+        parser.add_argument("--since", help="Не раньше этой даты.")
+        parser.add_argument("--until", help="Раньше этой даты.")
+        parser.add_argument("--group", help="Слаг группы.")
+        parser.add_argument("--author", help="Имя пользователя автора.")
+        parser.add_argument(
+            "--after-id", type=int, default=0,
+            help="Выгружать строки с id больше этого.")
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument(
+            "--output", help="Файл для выгрузки, по умолчанию stdout.")
+
+    def handle(self, *args, kind, format, after_id, chunk_size, output,
+               **options):
+        form = ExportForm({
+            name: options[name]
+            for name in ("since", "until", "group", "author")
+            if options[name]
+        })
+        if not form.is_valid():
+            raise CommandError(form.errors.as_text())
+        filters = {
+            name: form.cleaned_data[name]
+            for name in ("since", "until", "group", "author")
+        }
+        table = EXPORTS[kind]
+        try:
+            rows = table.rows(after=after_id, chunk_size=chunk_size, **filters)
+        except ValueError as error:
+            raise CommandError(error)
+        lines = render(rows, table.fields, format)
+        if output is None:
+            for line in lines:
+                self.stdout.write(line, ending="")
+            return
+        with open(output, "w", encoding="utf-8", newline="") as file:
+            file.writelines(lines)
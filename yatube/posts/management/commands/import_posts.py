@@ -0,0 +1,60 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.export import FORMATS
+from posts.imports import IMPORTERS, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Загружает посты, комментарии или подписки из выгрузки JSONL/CSV "
+        "порциями через bulk_create.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=list(IMPORTERS))
+        parser.add_argument("path", help="Файл выгрузки, «-» — stdin.")
+        parser.add_argument(
+            "--format", choices=list(FORMATS),
+            help="По умолчанию определяется по расширению файла.")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--images-from",
+            help="Каталог, из которого картинки постов копируются "
+                 "в хранилище по их путям из выгрузки.")
+        parser.add_argument(
+            "--progress-every", type=int, default=100_000,
+            help="Как часто сообщать о ходе загрузки, в строках.")
+
+    def handle(self, *args, kind, path, format, batch_size, images_from,
+               progress_every, **options):
+        format = format or path.rpartition(".")[2]
+        if format not in FORMATS:
+            raise CommandError("Укажите формат файла через --format.")
+        options = {"images_from": images_from} if kind == "posts" else {}
+        importer = IMPORTERS[kind](batch_size, **options)
+        file = (
+            sys.stdin if path == "-"
+            else open(path, encoding="utf-8", newline=""))
+        started = time.perf_counter()
+        total = reported = 0
+        try:
+            for count in importer.run(read_rows(file, format)):
+                total += count
+                if total - reported >= progress_every:
+                    reported = total
+                    self.report(total, started)
+        finally:
+            if file is not sys.stdin:
+                file.close()
+        self.report(total, started)
+        if getattr(importer, "missing_images", 0):
+            self.stderr.write(
+                f"Картинок не найдено: {importer.missing_images}.")
+
+    def report(self, total, started):
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"Загружено {total} строк за {elapsed:.1f} с, "
+            f"{total / max(elapsed, 1e-9):.0f} строк/с.")
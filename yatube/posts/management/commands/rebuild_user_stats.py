@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import User, UserStats
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает счётчики статистики пользователей с нуля."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=1000,
+            help="Сколько пользователей пересчитывать за один проход.")
+
+    def handle(self, *args, batch_size, **options):
+        user_ids = User.objects.order_by("pk").values_list("pk", flat=True)
+        total = 0
+        batch = []
+        for user_id in user_ids.iterator():
+            batch.append(user_id)
+            if len(batch) == batch_size:
+                total += len(UserStats.objects.rebuild(*batch))
+                batch = []
+        if batch:
+            total += len(UserStats.objects.rebuild(*batch))
+        self.stdout.write(f"Пересчитана статистика {total} пользователей.")
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        "Заполняет сохранённый HTML и начало текста постов, у которых их "
+        "ещё нет, например после миграции.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=1000,
+            help="Сколько постов обновлять за одну транзакцию.")
+        parser.add_argument(
+            "--all", action="store_true",
+            help="Перерисовать все посты, а не только незаполненные.")
+
+    def handle(self, *args, batch_size, all, **options):
+        posts = Post.objects.order_by("pk").only("text")
+        if not all:
+            posts = posts.filter(text_html="")
+        total = last_pk = 0
+        while True:
+            batch = list(posts.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            for post in batch:
+                post.render_text()
+            with transaction.atomic():
+                Post.objects.bulk_update(
+                    batch, ["text_html", "text_preview"])
+            total += len(batch)
+            last_pk = batch[-1].pk
+        self.stdout.write(f"Отрисован текст {total} постов.")
@@ -0,0 +1,186 @@
+import io
+import itertools
+import random
+import time
+from datetime import datetime, timedelta
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+from faker import Faker
+from PIL import Image, ImageDraw
+
+from posts.imports import CommentImporter, FollowImporter, PostImporter
+from posts.models import IMAGE_DIRECTORY, Group, Post
+
+
+def zipf_weights(size, exponent):
+    """Накопленные веса закона Ципфа: первый элемент — самый частый."""
+    return list(itertools.accumulate(
+        1 / rank ** exponent for rank in range(1, size + 1)))
+
+
+class Command(BaseCommand):
+    help = (
+        "Заполняет базу синтетическими данными для нагрузочных тестов: "
+        "пользователи со степенным распределением подписчиков, посты "
+        "по группам, комментарии к популярным постам и картинки. "
+        "На пустой базе одно и то же зерно даёт одни и те же данные.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10_000)
+        parser.add_argument("--groups", type=int, default=100)
+        parser.add_argument("--posts", type=int, default=1_000_000)
+        parser.add_argument("--comments", type=int, default=1_000_000)
+        parser.add_argument(
+            "--following", type=int, default=20,
+            help="Сколько в среднем подписок у пользователя.")
+        parser.add_argument(
+            "--exponent", type=float, default=1.1,
+            help="Показатель степенного закона для активности авторов, "
+                 "числа их подписчиков и популярности групп.")
+        parser.add_argument(
+            "--hot-posts", type=float, default=0.001,
+            help="Доля «горячих» постов.")
+        parser.add_argument(
+            "--hot-comments", type=float, default=0.5,
+            help="Доля комментариев, которые достаются горячим постам.")
+        parser.add_argument(
+            "--images", type=float, default=0.1,
+            help="Доля постов с картинкой.")
+        parser.add_argument(
+            "--image-pool", type=int, default=20,
+            help="Сколько разных картинок создать в хранилище.")
+        parser.add_argument(
+            "--start", type=datetime.fromisoformat,
+            default=datetime(2022, 1, 1),
+            help="Дата первого поста, посты равномерно идут после неё.")
+        parser.add_argument("--days", type=int, default=365)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, users, groups, posts, comments, following,
+               exponent, hot_posts, hot_comments, images, image_pool, start,
+               days, seed, batch_size, **options):
+        self.picks = random.Random(seed)
+        self.fake = Faker("ru_RU")
+        self.fake.seed_instance(seed)
+        # Тексты собираются из заранее созданных предложений: так
+        # генерация не медленнее записи в базу.
+        self.sentences = [self.fake.sentence() for _ in range(10_000)]
+        usernames = [
+            f"{self.fake.user_name()}_{i}" for i in range(users)]
+        slugs = self.groups(groups)
+        image_names = self.images(image_pool) if images else []
+        first_id = (Post.objects.aggregate(last=Max("id"))["last"] or 0) + 1
+        self.start = start
+        self.step = timedelta(days=days) / max(posts, 1)
+        self.load("постов", PostImporter(batch_size), self.posts(
+            first_id, posts, usernames, slugs, exponent, images,
+            image_names))
+        self.load("подписок", FollowImporter(batch_size), self.follows(
+            usernames, following, exponent))
+        hot = self.picks.sample(
+            range(posts), min(posts, max(1, int(posts * hot_posts))))
+        self.load("комментариев", CommentImporter(batch_size), self.comments(
+            first_id, posts, comments, usernames, hot, hot_comments))
+
+    def text(self, low, high):
+        count = self.picks.randint(low, high)
+        return " ".join(self.picks.choices(self.sentences, k=count))
+
+    def groups(self, count):
+        slugs = [f"load-{i}" for i in range(count)]
+        Group.objects.bulk_create(
+            (
+                Group(
+                    title=self.fake.sentence(nb_words=3).rstrip("."),
+                    slug=slug,
+                    description=self.text(1, 3),
+                )
+                for slug in slugs
+            ),
+            ignore_conflicts=True)
+        return slugs
+
+    def images(self, count):
+        """Картинки для постов: цветной фон с прямоугольниками."""
+        names = []
+        for i in range(count):
+            name = f"{IMAGE_DIRECTORY}load/{i}.png"
+            image = Image.new("RGB", (800, 600), self.color())
+            draw = ImageDraw.Draw(image)
+            for _ in range(5):
+                x, y = self.picks.randrange(700), self.picks.randrange(500)
+                draw.rectangle(
+                    [x, y, x + self.picks.randint(20, 300),
+                     y + self.picks.randint(20, 300)],
+                    fill=self.color())
+            buffer = io.BytesIO()
+            image.save(buffer, "PNG")
+            if not default_storage.exists(name):
+                name = default_storage.save(
+                    name, ContentFile(buffer.getvalue()))
+            names.append(name)
+        return names
+
+    def color(self):
+        return tuple(self.picks.randrange(256) for _ in range(3))
+
+    def posts(self, first_id, count, usernames, slugs, exponent, images,
+              image_names):
+        authors = zipf_weights(len(usernames), exponent)
+        groups = zipf_weights(len(slugs), exponent)
+        for i in range(count):
+            yield {
+                "id": first_id + i,
+                "pub_date": self.start + self.step * i,
+                "author__username": self.picks.choices(
+                    usernames, cum_weights=authors)[0],
+                # Каждый пятый пост — вне групп.
+                "group__slug": self.picks.choices(
+                    slugs, cum_weights=groups)[0]
+                if slugs and self.picks.random() >= 0.2 else None,
+                "text": self.text(1, 6),
+                "image": self.picks.choice(image_names)
+                if image_names and self.picks.random() < images else None,
+            }
+
+    def follows(self, usernames, following, exponent):
+        """Подписчиков у автора тем больше, чем он активнее."""
+        users = len(usernames)
+        scale = users * following / zipf_weights(users, exponent)[-1]
+        for rank, author in enumerate(usernames, 1):
+            count = min(users - 1, round(scale / rank ** exponent))
+            for index in self.picks.sample(range(users - 1), count):
+                # Автор пропускается: подписаться на себя нельзя.
+                index += index >= rank - 1
+                yield {
+                    "user__username": usernames[index],
+                    "author__username": author,
+                }
+
+    def comments(self, first_id, posts, count, usernames, hot, hot_share):
+        if not posts:
+            return
+        for _ in range(count):
+            if self.picks.random() < hot_share:
+                index = self.picks.choice(hot)
+            else:
+                index = self.picks.randrange(posts)
+            yield {
+                "post_id": first_id + index,
+                "author__username": self.picks.choice(usernames),
+                "text": self.text(1, 2),
+                "created": self.start + self.step * index + timedelta(
+                    seconds=self.picks.randrange(3 * 24 * 60 * 60)),
+            }
+
+    def load(self, title, importer, rows):
+        started = time.perf_counter()
+        total = sum(importer.run(rows))
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"Создано {total} {title} за {elapsed:.1f} с, "
+            f"{total / max(elapsed, 1e-9):.0f} строк/с.")
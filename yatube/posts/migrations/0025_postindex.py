@@ -0,0 +1,60 @@
+# Generated by Django 2.2.16 on 2026-10-18 03:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+import posts.models
+
+# Индекс хранит только термины, текст читается из posts_post. Триггеры
+# живут на posts_post: если SQLite пересоберёт эту таблицу при изменении
+# её схемы, триггеры нужно будет создать заново.
+CREATE_INDEX = """
+CREATE VIRTUAL TABLE posts_post_fts USING fts5(
+    text,
+    content='posts_post',
+    content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER posts_post_fts_insert AFTER INSERT ON posts_post BEGIN
+    INSERT INTO posts_post_fts (rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER posts_post_fts_delete AFTER DELETE ON posts_post BEGIN
+    INSERT INTO posts_post_fts (posts_post_fts, rowid, text)
+    VALUES ('delete', old.id, old.text);
+END;
+CREATE TRIGGER posts_post_fts_update AFTER UPDATE OF text ON posts_post BEGIN
+    INSERT INTO posts_post_fts (posts_post_fts, rowid, text)
+    VALUES ('delete', old.id, old.text);
+    INSERT INTO posts_post_fts (rowid, text) VALUES (new.id, new.text);
+END;
+INSERT INTO posts_post_fts (posts_post_fts) VALUES ('rebuild');
+"""
+
+DROP_INDEX = """
+DROP TRIGGER posts_post_fts_insert;
+DROP TRIGGER posts_post_fts_delete;
+DROP TRIGGER posts_post_fts_update;
+DROP TABLE posts_post_fts;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0024_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_INDEX, DROP_INDEX),
+        migrations.CreateModel(
+            name='PostIndex',
+            fields=[
+                ('post', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='posts.Post')),
+                ('text', posts.models.SearchTextField()),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'posts_post_fts',
+                'managed': False,
+            },
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:02
+
+from django.db import migrations, models
+
+# SQLite добавляет поля, пересобирая posts_post, и триггеры
+# полнотекстового индекса из 0025 пропадают вместе со старой таблицей.
+# Сам индекс не меняется: id постов при пересборке сохраняются.
+CREATE_TRIGGERS = """
+CREATE TRIGGER IF NOT EXISTS posts_post_fts_insert
+AFTER INSERT ON posts_post BEGIN
+    INSERT INTO posts_post_fts (rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS posts_post_fts_delete
+AFTER DELETE ON posts_post BEGIN
+    INSERT INTO posts_post_fts (posts_post_fts, rowid, text)
+    VALUES ('delete', old.id, old.text);
+END;
+CREATE TRIGGER IF NOT EXISTS posts_post_fts_update
+AFTER UPDATE OF text ON posts_post BEGIN
+    INSERT INTO posts_post_fts (posts_post_fts, rowid, text)
+    VALUES ('delete', old.id, old.text);
+    INSERT INTO posts_post_fts (rowid, text) VALUES (new.id, new.text);
+END;
+"""
+
+DROP_TRIGGERS = """
+DROP TRIGGER IF EXISTS posts_post_fts_insert;
+DROP TRIGGER IF EXISTS posts_post_fts_delete;
+DROP TRIGGER IF EXISTS posts_post_fts_update;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0025_postindex'),
+    ]
+
+    operations = [
+        # При откате поля удаляются той же пересборкой таблицы.
+        migrations.RunSQL(migrations.RunSQL.noop, CREATE_TRIGGERS),
+        migrations.AddField(
+            model_name='post',
+            name='text_html',
+            field=models.TextField(blank=True, editable=False, verbose_name='HTML текста'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='text_preview',
+            field=models.CharField(blank=True, editable=False, max_length=30, verbose_name='Начало текста'),
+        ),
+        migrations.RunSQL(CREATE_TRIGGERS, DROP_TRIGGERS),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 2.2.16 on 2026-10-18 09:12
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0026_post_text_html'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feedentry',
+            name='pub_date',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Дата публикации поста'),
+            preserve_default=False,
+        ),
+        migrations.RunSQL(
+            "UPDATE posts_feedentry SET pub_date = ("
+            "SELECT pub_date FROM posts_post"
+            " WHERE posts_post.id = posts_feedentry.post_id)",
+            migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name='feedentry',
+            index=models.Index(fields=['user', '-pub_date', '-post'], name='feed_entry_user_date_idx'),
+        ),
+    ]
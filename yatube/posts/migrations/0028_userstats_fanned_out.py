@@ -0,0 +1,27 @@
+# Generated by Django 2.2.16 on 2026-10-18 11:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def stop_popular_fan_out(apps, schema_editor):
+    UserStats = apps.get_model('posts', 'UserStats')
+    UserStats.objects.filter(
+        followers_count__gte=settings.FEED_FANOUT_LIMIT,
+    ).update(fanned_out=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0027_feedentry_pub_date'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userstats',
+            name='fanned_out',
+            field=models.BooleanField(default=True, verbose_name='Посты рассылаются'),
+        ),
+        migrations.RunPython(stop_popular_fan_out, migrations.RunPython.noop),
+    ]
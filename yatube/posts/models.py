@@ -1,7 +1,16 @@
+import hashlib
+import re
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, F, Q
+from django.utils.html import linebreaks
+from django.utils.safestring import mark_safe
+from django.utils.text import Truncator
 
 IMAGE_DIRECTORY = 'posts/'
+PREVIEW_LENGTH = 30
 
 User = get_user_model()
 
@@ -19,6 +28,72 @@ class Group(models.Model):
         return self.title
 
 
+def match_query(text):
+    """Запрос FTS5 из слов пользователя: нужны все слова, каждое как начало.
+
+    Слова берутся в кавычки, поэтому операторы и скобки из ввода не
+    разбираются как синтаксис FTS5.
+    """
+    return " ".join(f'"{word}"*' for word in re.findall(r"\w+", text))
+
+
+class PostQuerySet(models.QuerySet):
+    def for_feed(self):
+        """Посты для ленты: автор и группа одним запросом, без лишних полей."""
+        return self.select_related("author", "group").only(
+            # Текст нужен постам, у которых ещё нет сохранённого HTML.
+            "text",
+            "text_html",
+            "pub_date",
+            "image",
+            "author__username",
+            "author__first_name",
+            "author__last_name",
+            "group__slug",
+            "group__title",
+        )
+
+    def search(self, text):
+        """Посты со всеми словами запроса, сначала самые релевантные."""
+        query = match_query(text)
+        if not query:
+            return self.none()
+        return self.filter(search_index__text__match=query).annotate(
+            rank=F("search_index__rank")).order_by("rank", "-id")
+
+    def for_follower(self, user):
+        """Лента подписок пользователя.
+
+        Посты обычных авторов берутся из разосланных при публикации записей
+        FeedEntry, а посты авторов с огромным числом подписчиков, которые
+        не рассылаются, подмешиваются при чтении. Такой запрос сортирует
+        всю ленту, поэтому курсором она листается по follower_sources.
+        """
+        return self.filter(
+            Q(pk__in=FeedEntry.objects.filter(user=user).values("post"))
+            | Q(author__in=popular_follows(user)))
+
+    def follower_sources(self, user):
+        """Ключи постов ленты подписок, упорядоченные каждый по своему индексу.
+
+        Записи FeedEntry читателя и посты популярных авторов отсортированы
+        так же, как лента, и заканчиваются id поста; страница собирается
+        из них MergedKeysetPaginator.
+        """
+        return [
+            FeedEntry.objects.filter(user=user).order_by(
+                "-pub_date", "-post_id"),
+            Post.objects.filter(author__in=popular_follows(user)).order_by(
+                "-pub_date", "-id"),
+        ]
+
+
+def popular_follows(user):
+    """Авторы, на которых подписан пользователь, без рассылки постов."""
+    return Follow.objects.filter(
+        user=user, author__stats__fanned_out=False).values("author")
+
+
 class Post(models.Model):
     text = models.TextField(verbose_name="Текст")
     pub_date = models.DateTimeField(
@@ -44,15 +119,134 @@ class Post(models.Model):
         upload_to=IMAGE_DIRECTORY,
         blank=True
     )
+    # Текст, отрисованный при сохранении, чтобы лента не прогоняла
+    # фильтры по каждому посту при каждом показе.
+    text_html = models.TextField("HTML текста", blank=True, editable=False)
+    text_preview = models.CharField(
+        "Начало текста",
+        max_length=PREVIEW_LENGTH,
+        blank=True,
+        editable=False,
+    )
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
-        ordering = ("-pub_date",)
+        ordering = ("-pub_date", "-id")
         verbose_name = "Пост"
         verbose_name_plural = "Посты"
+        # Индексы лент повторяют их сортировку целиком, чтобы страница
+        # читалась из индекса по порядку, без сортировки всех постов.
+        indexes = [
+            models.Index(
+                fields=["-pub_date", "-id"], name="post_pub_date_idx"),
+            models.Index(
+                fields=["author", "-pub_date", "-id"],
+                name="post_author_pub_date_idx"),
+            models.Index(
+                fields=["group", "-pub_date", "-id"],
+                name="post_group_pub_date_idx"),
+        ]
 
     def __str__(self):
         return self.text[:15]
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or "text" in update_fields:
+            self.render_text()
+            if update_fields is not None:
+                kwargs["update_fields"] = {
+                    *update_fields, "text_html", "text_preview"}
+        super().save(*args, **kwargs)
+
+    def render_text(self):
+        """HTML и начало текста — то же, что дают фильтры linebreaks
+        и truncatechars."""
+        self.text_html = linebreaks(self.text, autoescape=True)
+        self.text_preview = Truncator(self.text).chars(PREVIEW_LENGTH)
+
+    def get_text_html(self):
+        # Посты, которые ещё не заполнила render_post_text, рисуются на лету.
+        if not self.text_html:
+            self.render_text()
+        return mark_safe(self.text_html)
+
+    def get_card_version(self):
+        """Версия карточки поста в лентах.
+
+        Собрана из всего, что выводит карточка: текста, даты, картинки,
+        группы и автора, — поэтому правка поста, переименование автора или
+        группы дают новую карточку без сброса кеша.
+        """
+        group = self.group
+        parts = [
+            self.text_html or self.text,
+            self.pub_date.isoformat(),
+            self.image.name or "",
+            group.slug if group else "",
+            group.title if group else "",
+            self.author.username,
+            self.author.get_full_name(),
+        ]
+        return hashlib.md5("\0".join(parts).encode()).hexdigest()
+
+    def get_text_preview(self):
+        if not self.text_preview:
+            self.render_text()
+        return self.text_preview
+
+
+class Match(models.Lookup):
+    lookup_name = "match"
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f"{lhs} MATCH {rhs}", lhs_params + rhs_params
+
+
+class SearchTextField(models.TextField):
+    """Колонка полнотекстового индекса, поддерживает lookup ``match``."""
+
+
+SearchTextField.register_lookup(Match)
+
+
+class PostIndex(models.Model):
+    """Полнотекстовый индекс SQLite FTS5 по тексту постов.
+
+    Виртуальная таблица создаётся миграцией и обновляется триггерами базы
+    на вставку, изменение и удаление постов, поэтому в неё попадают и
+    массовые операции без сигналов. ``rank`` — релевантность по BM25
+    (меньше — лучше), она есть только в запросах с ``match``.
+    """
+    post = models.OneToOneField(
+        Post,
+        primary_key=True,
+        db_column="rowid",
+        db_constraint=False,
+        on_delete=models.DO_NOTHING,
+        related_name="search_index",
+    )
+    text = SearchTextField()
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = "posts_post_fts"
+
+
+class CommentQuerySet(models.QuerySet):
+    def for_thread(self):
+        """Комментарии в порядке написания вместе с авторами."""
+        return self.select_related("author").only(
+            "text",
+            "created",
+            "post_id",
+            "author__username",
+        ).order_by("created", "id")
+
 
 class Comment(models.Model):
     post = models.ForeignKey(
@@ -75,9 +269,15 @@ class Comment(models.Model):
         verbose_name="Дата комментария",
     )
 
+    objects = CommentQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Комментарий"
         verbose_name_plural = "Комментарии"
+        indexes = [
+            models.Index(
+                fields=["post", "created"], name="comment_post_created_idx"),
+        ]
 
     def __str__(self):
         return self.text[:15]
@@ -105,6 +305,160 @@ class Follow(models.Model):
                 fields=("user", "author"),
                 name="unique follow")
         ]
+        # Уникальность (user, author) ищет подписки читателя, а этот
+        # индекс — подписчиков автора при рассылке постов.
+        indexes = [
+            models.Index(
+                fields=["author", "user"], name="follow_author_user_idx"),
+        ]
 
     def __str__(self):
         return f"{self.user.username} -> {self.author.username}"
+
+
+class UserStatsManager(models.Manager):
+    def rebuild(self, *user_ids):
+        """Пересчитать счётчики пользователей по исходным таблицам."""
+        counters = {
+            user_id: {
+                "posts_count": 0,
+                "comments_count": 0,
+                "followers_count": 0,
+                "following_count": 0,
+            }
+            for user_id in user_ids
+        }
+        sources = (
+            ("posts_count", Post, "author"),
+            ("comments_count", Comment, "author"),
+            ("followers_count", Follow, "author"),
+            ("following_count", Follow, "user"),
+        )
+        for counter, model, column in sources:
+            totals = model.objects.filter(
+                **{f"{column}__in": user_ids}
+            ).values(column).annotate(total=Count("pk")).order_by()
+            for row in totals:
+                counters[row[column]][counter] = row["total"]
+        with transaction.atomic():
+            # Возобновить рассылку значит дозаполнить ленты, поэтому
+            # пересчёт только прекращает её у популярных авторов.
+            fanned_out = dict(self.filter(user_id__in=user_ids).values_list(
+                "user_id", "fanned_out"))
+            for user_id, values in counters.items():
+                values["fanned_out"] = fanned_out.get(user_id, True) and (
+                    values["followers_count"] < settings.FEED_FANOUT_LIMIT)
+            self.filter(user_id__in=user_ids).delete()
+            return self.bulk_create(
+                self.model(user_id=user_id, **values)
+                for user_id, values in counters.items())
+
+    def for_user(self, user):
+        """Счётчики пользователя; недостающая строка собирается заново."""
+        try:
+            return user.stats
+        except self.model.DoesNotExist:
+            return self.rebuild(user.pk)[0]
+
+
+class UserStats(models.Model):
+    user = models.OneToOneField(
+        User,
+        primary_key=True,
+        on_delete=models.CASCADE,
+        verbose_name="Пользователь",
+        related_name="stats",
+    )
+    posts_count = models.PositiveIntegerField("Постов", default=0)
+    comments_count = models.PositiveIntegerField("Комментариев", default=0)
+    followers_count = models.PositiveIntegerField("Подписчиков", default=0)
+    following_count = models.PositiveIntegerField("Подписок", default=0)
+    # Рассылаются ли посты автора по лентам подписчиков при публикации.
+    # Рассылка прекращается на FEED_FANOUT_LIMIT подписчиков, а возобновляется
+    # ниже FEED_FANOUT_RESUME_LIMIT, см. posts.signals.
+    fanned_out = models.BooleanField("Посты рассылаются", default=True)
+
+    objects = UserStatsManager()
+
+    class Meta:
+        verbose_name = "Статистика пользователя"
+        verbose_name_plural = "Статистика пользователей"
+
+    def __str__(self):
+        return f"{self.user_id}: {self.posts_count} постов"
+
+
+class FeedEntryManager(models.Manager):
+    def fan_out(self, post, follower_ids=None):
+        """Разослать пост по лентам подписчиков автора."""
+        if follower_ids is None:
+            follower_ids = Follow.objects.filter(
+                author_id=post.author_id).values_list("user_id", flat=True)
+        return self.bulk_create(
+            (
+                self.model(user_id=user_id, post=post, pub_date=post.pub_date)
+                for user_id in follower_ids
+            ),
+            batch_size=settings.FEED_BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+    def backfill(self, user_id, author_id):
+        """Добавить в ленту подписчика последние посты автора."""
+        return self.backfill_many([user_id], author_id)
+
+    def backfill_many(self, user_ids, author_id):
+        """Добавить последние посты автора в ленты нескольких подписчиков."""
+        posts = list(Post.objects.filter(author_id=author_id).values_list(
+            "pk", "pub_date")[:settings.FEED_BACKFILL_LIMIT])
+        return self.bulk_create(
+            (
+                self.model(user_id=user_id, post_id=post_id, pub_date=pub_date)
+                for user_id in user_ids
+                for post_id, pub_date in posts
+            ),
+            batch_size=settings.FEED_BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+    def prune(self, user_id, author_id):
+        """Убрать из ленты подписчика посты автора."""
+        return self.filter(user_id=user_id, post__author_id=author_id).delete()
+
+
+class FeedEntry(models.Model):
+    """Пост в материализованной ленте подписок пользователя."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name="Читатель",
+        related_name="feed_entries",
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        verbose_name="Пост",
+        related_name="feed_entries",
+    )
+    # Копия даты поста: страница ленты читается из индекса записей
+    # по порядку, без соединения с постами.
+    pub_date = models.DateTimeField("Дата публикации поста")
+
+    objects = FeedEntryManager()
+
+    class Meta:
+        verbose_name = "Запись ленты"
+        verbose_name_plural = "Записи ленты"
+        constraints = [
+            models.UniqueConstraint(
+                fields=("user", "post"),
+                name="unique feed entry")
+        ]
+        indexes = [
+            models.Index(
+                fields=["user", "-pub_date", "-post"],
+                name="feed_entry_user_date_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} <- {self.post_id}"
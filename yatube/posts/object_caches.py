@@ -0,0 +1,10 @@
+"""Кеши постов, групп и пользователей для поиска по адресу страницы."""
+from core.object_cache import ObjectCache
+from .models import Group, Post, User
+
+# Счётчики автора меняются постоянно и в кеш не попадают, но при промахе
+# читаются тем же запросом, что и сам объект.
+users = ObjectCache(
+    User.objects.defer("password"), ("pk", "username"), related=("stats",))
+groups = ObjectCache(Group.objects.all(), ("pk", "slug"))
+posts = ObjectCache(Post.objects.all(), related=("author__stats", "group"))
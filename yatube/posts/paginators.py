@@ -0,0 +1,242 @@
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from core.caching import get_or_set
+
+CURSOR_SALT = "posts.paginators.cursor"
+NEXT = "n"
+PREVIOUS = "p"
+
+
+class WindowedPaginator(Paginator):
+    """Пагинатор с укороченным списком страниц.
+
+    Вместо ссылки на каждую страницу выводятся первые и последние
+    страницы и окно вокруг текущей, а пропуски заменяются многоточием.
+    Список для текущей страницы лежит в атрибуте ``elided_page_range``.
+    """
+    ELLIPSIS = "…"
+
+    def get_elided_page_range(self, number=1, *, on_each_side=3, on_ends=2):
+        """Номера страниц вокруг ``number`` с многоточиями на месте пропусков.
+
+        Повторяет ``Paginator.get_elided_page_range`` из Django 3.2.
+        """
+        number = self.validate_number(number)
+        if self.num_pages <= (on_each_side + on_ends) * 2:
+            yield from self.page_range
+            return
+        if number > 1 + on_each_side + on_ends + 1:
+            yield from range(1, on_ends + 1)
+            yield self.ELLIPSIS
+            yield from range(number - on_each_side, number + 1)
+        else:
+            yield from range(1, number + 1)
+        if number < self.num_pages - on_each_side - on_ends - 1:
+            yield from range(number + 1, number + on_each_side + 1)
+            yield self.ELLIPSIS
+            yield from range(self.num_pages - on_ends + 1, self.num_pages + 1)
+        else:
+            yield from range(number + 1, self.num_pages + 1)
+
+    def _get_page(self, *args, **kwargs):
+        page = super()._get_page(*args, **kwargs)
+        page.elided_page_range = list(
+            self.get_elided_page_range(page.number))
+        return page
+
+
+class CountingPaginator(WindowedPaginator):
+    """Пагинатор, который не считает большие ленты целиком.
+
+    Число записей хранится в кеше под ключом ``count_key``, в который
+    вызывающий код включает версию данных ленты. При промахе записи
+    считаются только до ``exact_limit``; лента длиннее оценивается по темпу
+    публикаций: с той же скоростью, с какой появились ``exact_limit``
+    последних записей, лента заполнялась с самой старой.
+    """
+
+    def __init__(self, object_list, per_page, count_key, exact_limit,
+                 timeout, date_field="pub_date"):
+        super().__init__(object_list, per_page)
+        self.count_key = count_key
+        self.exact_limit = exact_limit
+        self.timeout = timeout
+        self.date_field = date_field
+
+    @cached_property
+    def count(self):
+        return get_or_set(self.count_key, self.exact_count, self.timeout)
+
+    def exact_count(self):
+        count = self.object_list[:self.exact_limit + 1].count()
+        if count > self.exact_limit:
+            count = self.estimate_count()
+        return count
+
+    def estimate_count(self):
+        """Оценка длины ленты по датам трёх записей из индекса."""
+        dates = self.object_list.values_list(self.date_field, flat=True)
+        newest = dates[0]
+        recent = (newest - dates[self.exact_limit]).total_seconds()
+        total = (newest - dates.reverse()[0]).total_seconds()
+        if recent <= 0:
+            return self.exact_limit + 1
+        return max(
+            self.exact_limit + 1,
+            1 + round(self.exact_limit * total / recent))
+
+
+class KeysetPaginator(Paginator):
+    """Пагинатор по ключу сортировки вместо LIMIT/OFFSET.
+
+    Страница выбирается условием «строго после (до) последней записи
+    предыдущей страницы», поэтому глубокие страницы не пропускают тысячи
+    строк и не требуют COUNT(*). Сортировка должна однозначно упорядочивать
+    записи, то есть заканчиваться первичным ключом; кроме полей модели
+    в ней могут быть аннотации, например релевантность поиска.
+
+    Страницы остаются обычными ``Page``: курсоры соседних страниц лежат
+    в атрибутах ``next_cursor`` и ``previous_cursor``, а номер страницы
+    переносится в курсоре, чтобы не считать записи ленты.
+    """
+    keyset = True
+
+    def __init__(self, object_list, per_page, ordering=None):
+        self.ordering = tuple(
+            ordering
+            or object_list.query.order_by
+            or object_list.model._meta.ordering)
+        super().__init__(object_list.order_by(*self.ordering), per_page)
+        self.fields = [
+            self._get_field(object_list, name.lstrip("-"))
+            for name in self.ordering
+        ]
+
+    @staticmethod
+    def _get_field(object_list, name):
+        """Поле модели или аннотации, по которому сортируется выборка."""
+        annotation = object_list.query.annotations.get(name)
+        if annotation is None:
+            return object_list.model._meta.get_field(name)
+        field = annotation.output_field.clone()
+        field.set_attributes_from_name(name)
+        return field
+
+    def get_page(self, cursor=None):
+        """Вернуть страницу по курсору; битый курсор ведёт на первую."""
+        try:
+            direction, key, number = self.decode_cursor(cursor)
+        except (signing.BadSignature, ValidationError, TypeError, ValueError):
+            direction, key, number = NEXT, None, 1
+        return self.page(direction, key, number)
+
+    @property
+    def num_pages(self):
+        """Известная часть ленты: до текущей страницы и ещё одна, если есть."""
+        return self._num_pages
+
+    def page(self, direction=NEXT, key=None, number=1):
+        rows = self.rows(key, direction == PREVIOUS, self.per_page + 1)
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction == PREVIOUS:
+            if not rows:
+                return self.page()
+            rows.reverse()
+            has_previous, has_next = has_more, key is not None
+        else:
+            has_previous, has_next = key is not None and bool(rows), has_more
+        if not has_previous:
+            number = 1
+        self._num_pages = number + 1 if has_next else number
+        page = self._get_page(rows, number, self)
+        page.next_cursor = (
+            self.encode_cursor(NEXT, rows[-1], number + 1)
+            if has_next else None)
+        page.previous_cursor = (
+            self.encode_cursor(PREVIOUS, rows[0], number - 1)
+            if has_previous else None)
+        return page
+
+    def rows(self, key, backwards, limit):
+        """Первые ``limit`` записей после ключа (или до него, по убыванию)."""
+        queryset = self.object_list
+        if key is not None:
+            queryset = queryset.filter(self._seek(key, backwards))
+        if backwards:
+            queryset = queryset.reverse()
+        return list(queryset[:limit])
+
+    def encode_cursor(self, direction, obj, number):
+        return signing.dumps(
+            [
+                direction,
+                [field.value_to_string(obj) for field in self.fields],
+                number,
+            ],
+            salt=CURSOR_SALT)
+
+    def decode_cursor(self, cursor):
+        if not cursor:
+            return NEXT, None, 1
+        direction, values, number = signing.loads(cursor, salt=CURSOR_SALT)
+        if direction not in (NEXT, PREVIOUS) or (
+                len(values) != len(self.fields)):
+            raise ValueError("Malformed cursor")
+        return direction, [
+            field.to_python(value)
+            for field, value in zip(self.fields, values)
+        ], int(number)
+
+    def _seek(self, key, backwards=False):
+        return seek(self.ordering, key, backwards)
+
+
+class MergedKeysetPaginator(KeysetPaginator):
+    """Keyset-пагинатор по нескольким выборкам ключей записей.
+
+    ``sources`` — выборки, отсортированные так же, как ``object_list``,
+    последнее поле сортировки которых — первичный ключ его записей.
+    Курсор и LIMIT страницы применяются к каждой выборке по её индексу,
+    а записи читаются одним запросом по ключам, найденным во всех
+    выборках, так что сортировать приходится лишь несколько страниц.
+    """
+
+    def __init__(self, object_list, per_page, sources):
+        super().__init__(object_list, per_page)
+        self.sources = sources
+
+    def rows(self, key, backwards, limit):
+        found = Q()
+        for source in self.sources:
+            ordering = source.query.order_by
+            if key is not None:
+                source = source.filter(seek(ordering, key, backwards))
+            if backwards:
+                source = source.reverse()
+            found |= Q(pk__in=source.values(ordering[-1].lstrip("-"))[:limit])
+        queryset = self.object_list.filter(found)
+        if backwards:
+            queryset = queryset.reverse()
+        return list(queryset[:limit])
+
+
+def seek(ordering, key, backwards=False):
+    """Условие «после ключа» в порядке сортировки (или «до» него)."""
+    condition = Q()
+    for position, name in enumerate(ordering):
+        descending = name.startswith("-")
+        lookup = "lt" if descending != backwards else "gt"
+        step = Q(**{f"{name.lstrip('-')}__{lookup}": key[position]})
+        for previous, value in zip(ordering[:position], key):
+            step &= Q(**{previous.lstrip("-"): value})
+        condition |= step
+    # Нестрогое условие на первое поле повторяет уже сказанное, но
+    # даёт планировщику диапазон индекса вместо объединения поисков.
+    first = ordering[0]
+    lookup = "lte" if first.startswith("-") != backwards else "gte"
+    return Q(**{f"{first.lstrip('-')}__{lookup}": key[0]}) & condition
@@ -0,0 +1,191 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from core import caching, thumbnails
+from .models import Comment, FeedEntry, Follow, Group, Post, User, UserStats
+
+# Поля пользователя, которые выводятся в карточках постов.
+USER_DISPLAY_FIELDS = {"username", "first_name", "last_name"}
+
+
+def is_fanned_out(author_id):
+    """Рассылаются ли посты автора по лентам подписчиков при публикации."""
+    return not UserStats.objects.filter(
+        user_id=author_id, fanned_out=False).exists()
+
+
+def bump(user_id, counter, delta):
+    """Атомарно сдвинуть счётчик пользователя на delta.
+
+    Если строки статистики ещё нет, при увеличении она собирается заново
+    из исходных таблиц, а при уменьшении пересчёт откладывается до чтения.
+    Разошедшийся счётчик не уходит ниже нуля: поле беззнаковое.
+    """
+    updated = UserStats.objects.filter(user_id=user_id).update(
+        **{counter: Greatest(F(counter) + delta, 0)})
+    if not updated and delta > 0:
+        UserStats.objects.rebuild(user_id)
+
+
+@receiver(post_save, sender=Post)
+def post_created(sender, instance, created, **kwargs):
+    if created:
+        bump(instance.author_id, "posts_count", 1)
+        if is_fanned_out(instance.author_id):
+            FeedEntry.objects.fan_out(instance)
+
+
+@receiver(post_save, sender=Post)
+def post_image_saved(sender, instance, **kwargs):
+    if not instance.image:
+        return
+
+    def prepare_thumbnails():
+        for geometry_string, options in settings.POST_IMAGE_THUMBNAILS:
+            thumbnails.schedule(instance.image, geometry_string, **options)
+
+    transaction.on_commit(prepare_thumbnails)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    bump(instance.author_id, "posts_count", -1)
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, **kwargs):
+    if created:
+        bump(instance.author_id, "comments_count", 1)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    bump(instance.author_id, "comments_count", -1)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        bump(instance.author_id, "followers_count", 1)
+        bump(instance.user_id, "following_count", 1)
+        UserStats.objects.filter(
+            user_id=instance.author_id,
+            fanned_out=True,
+            followers_count__gte=settings.FEED_FANOUT_LIMIT,
+        ).update(fanned_out=False)
+        if is_fanned_out(instance.author_id):
+            FeedEntry.objects.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    bump(instance.author_id, "followers_count", -1)
+    bump(instance.user_id, "following_count", -1)
+    FeedEntry.objects.prune(instance.user_id, instance.author_id)
+    if UserStats.objects.filter(
+        user_id=instance.author_id,
+        fanned_out=False,
+        followers_count__lt=settings.FEED_FANOUT_RESUME_LIMIT,
+    ).update(fanned_out=True):
+        # Автор больше не подмешивается при чтении ленты: дозаполняем
+        # ленты оставшихся подписчиков постами, которые не были разосланы.
+        FeedEntry.objects.backfill_many(
+            Follow.objects.filter(author_id=instance.author_id).values_list(
+                "user_id", flat=True),
+            instance.author_id)
+
+
+def post_scopes(author_username, group_slug):
+    scopes = ["posts", f"author:{author_username}"]
+    if group_slug:
+        scopes.append(f"group:{group_slug}")
+    return scopes
+
+
+@receiver(pre_save, sender=Post)
+def remember_post_scopes(sender, instance, **kwargs):
+    instance._previous_scopes = []
+    if instance._state.adding:
+        return
+    previous = Post.objects.filter(pk=instance.pk).values_list(
+        "author__username", "group__slug").first()
+    if previous:
+        instance._previous_scopes = post_scopes(*previous)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_pages(sender, instance, **kwargs):
+    caching.bump(
+        f"post:{instance.pk}",
+        *getattr(instance, "_previous_scopes", []),
+        *post_scopes(
+            instance.author.username,
+            instance.group.slug if instance.group_id else None))
+
+
+@receiver(pre_save, sender=Group)
+def remember_group_slug(sender, instance, **kwargs):
+    instance._previous_slug = None
+    if not instance._state.adding:
+        instance._previous_slug = Group.objects.filter(
+            pk=instance.pk).values_list("slug", flat=True).first()
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group_pages(sender, instance, **kwargs):
+    previous_slug = getattr(instance, "_previous_slug", None)
+    caching.bump(
+        "posts",
+        "groups",
+        f"group:{instance.slug}",
+        *([f"group:{previous_slug}"] if previous_slug else []))
+
+
+@receiver(pre_save, sender=User)
+def remember_user_display(sender, instance, update_fields=None, **kwargs):
+    instance._previous_display = None
+    if instance._state.adding or update_fields is not None and not (
+            USER_DISPLAY_FIELDS & set(update_fields)):
+        return
+    instance._previous_display = User.objects.filter(
+        pk=instance.pk).values(*USER_DISPLAY_FIELDS).first()
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_pages(sender, instance, created, **kwargs):
+    previous = getattr(instance, "_previous_display", None)
+    if created or previous is None or all(
+            previous[field] == getattr(instance, field)
+            for field in USER_DISPLAY_FIELDS):
+        return
+    caching.bump(
+        "posts",
+        "users",
+        f"author:{previous['username']}",
+        f"author:{instance.username}")
+
+
+@receiver(post_delete, sender=User)
+def invalidate_deleted_user_pages(sender, instance, **kwargs):
+    caching.bump("posts", "users", f"author:{instance.username}")
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment_pages(sender, instance, **kwargs):
+    caching.bump(
+        f"post:{instance.post_id}", f"author:{instance.author.username}")
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow_pages(sender, instance, **kwargs):
+    caching.bump(
+        f"author:{instance.author.username}",
+        f"author:{instance.user.username}")
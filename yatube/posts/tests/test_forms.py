@@ -8,6 +8,7 @@ from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 
+from posts import object_caches
 from posts.models import Comment, Group, Post, User
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
@@ -87,6 +88,15 @@ class PostFormTest(TestCase):
         super().tearDownClass()
         shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
 
+    def test_post_edit_saves_current_post(self):
+        """Правка сохраняет пост из базы, а не его копию из кеша."""
+        object_caches.posts.get(pk=self.post.pk)
+        Post.objects.filter(pk=self.post.pk).update(image="posts/other.gif")
+        self.author.post(
+            self.POST_EDIT_URL, data={"text": "Новый текст для поста"})
+        self.assertEqual(
+            Post.objects.get(pk=self.post.pk).image.name, "posts/other.gif")
+
     def test_post_edit_by_anonym(self):
         """Аноним и не автор поста не могут его редактировать."""
         set = [
@@ -107,6 +117,8 @@ class PostFormTest(TestCase):
     def test_post_edit(self):
         """Валидная форма обновляет выбранный пост."""
         post_count = Post.objects.count()
+        # Картинку могли уже отправить в другом тесте класса.
+        self.PICTURE2.seek(0)
         response = self.author.post(
             self.POST_EDIT_URL, data=self.form_data, follow=True)
         self.assertRedirects(response, self.POST_DETAIL_URL)
@@ -1,6 +1,9 @@
+from io import StringIO
+
+from django.core.management import call_command
 from django.test import TestCase
 
-from ..models import Comment, Group, Post, User
+from ..models import Comment, Follow, Group, Post, User, UserStats
 
 
 class PostModelTest(TestCase):
@@ -27,3 +30,75 @@ class PostModelTest(TestCase):
         """Проверяем, что у моделей корректно работает __str__."""
         self.assertEqual(self.group.title, str(self.group))
         self.assertEqual(self.post.text[:15], str(self.post))
+
+
+class UserStatsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username="author")
+        cls.reader = User.objects.create_user(username="reader")
+        cls.post = Post.objects.create(author=cls.author, text="Текст")
+        Comment.objects.create(post=cls.post, author=cls.reader, text="Да")
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def assertStats(self, user, **expected):
+        stats = UserStats.objects.get(user=user)
+        for counter, value in expected.items():
+            with self.subTest(counter=counter):
+                self.assertEqual(getattr(stats, counter), value)
+
+    def test_counters_follow_writes(self):
+        """Счётчики меняются вместе с постами, комментариями, подписками."""
+        self.assertStats(self.author, posts_count=1, followers_count=1)
+        self.assertStats(
+            self.reader, comments_count=1, following_count=1)
+        Follow.objects.all().delete()
+        Post.objects.create(author=self.author, text="Ещё текст")
+        self.assertStats(self.author, posts_count=2, followers_count=0)
+        self.assertStats(self.reader, following_count=0)
+
+    def test_drifted_counter_does_not_go_below_zero(self):
+        """Удаление постов, созданных в обход сигналов, не ломает счётчик."""
+        Post.objects.bulk_create([Post(author=self.author, text="Импорт")])
+        Post.objects.filter(author=self.author).delete()
+        self.assertStats(self.author, posts_count=0)
+
+    def test_rebuild_command_fixes_drift(self):
+        """Команда rebuild_user_stats пересчитывает счётчики с нуля."""
+        UserStats.objects.update(posts_count=100, comments_count=100)
+        call_command("rebuild_user_stats", stdout=StringIO())
+        self.assertStats(self.author, posts_count=1, comments_count=0)
+        self.assertStats(self.reader, posts_count=0, comments_count=1)
+
+
+class PostTextHtmlTest(TestCase):
+    TEXT = "Первая строка <b>жирно</b>\n\nВторой абзац, длиннее 30 символов"
+
+    def setUp(self):
+        self.author = User.objects.create_user(username="author")
+
+    def test_text_is_rendered_on_save(self):
+        """HTML и начало текста совпадают с фильтрами и обновляются."""
+        post = Post.objects.create(author=self.author, text=self.TEXT)
+        self.assertEqual(
+            post.text_html,
+            "<p>Первая строка &lt;b&gt;жирно&lt;/b&gt;</p>\n\n"
+            "<p>Второй абзац, длиннее 30 символов</p>")
+        self.assertEqual(
+            post.text_preview, "Первая строка <b>жирно</b>\n\nВ…")
+        post.text = "Новый текст"
+        post.save(update_fields=["text"])
+        post.refresh_from_db()
+        self.assertEqual(post.text_html, "<p>Новый текст</p>")
+        self.assertEqual(post.text_preview, "Новый текст")
+
+    def test_render_command_fills_old_posts(self):
+        """Команда render_post_text заполняет посты без HTML."""
+        Post.objects.bulk_create([Post(author=self.author, text=self.TEXT)])
+        post = Post.objects.get()
+        self.assertEqual(post.text_html, "")
+        self.assertIn("<p>Второй абзац", post.get_text_html())
+        call_command("render_post_text", stdout=StringIO())
+        post.refresh_from_db()
+        self.assertIn("<p>Второй абзац", post.text_html)
@@ -16,6 +16,8 @@ class RoutesTest(TestCase):
             ["post_create", [], "/create/"],
             ["profile", [USERNAME], f"/profile/{USERNAME}/"],
             ["post_detail", [POST_ID], f"/posts/{POST_ID}/"],
+            ["search", [], "/search/"],
+            ["export", ["posts"], "/export/posts/"],
             ["post_edit", [POST_ID], f"/posts/{POST_ID}/edit/"],
             ["add_comment", [POST_ID], f"/posts/{POST_ID}/comment/"],
             ["follow_index", [], "/follow/"],
@@ -3,6 +3,7 @@ from django.core.cache import cache
 from django.test import Client, TestCase
 from django.urls import reverse
 
+from core.object_cache import ObjectCache
 from posts.models import Group, Post, User
 
 SLUG = "testslug"
@@ -19,6 +20,7 @@ FOLLOW_REDIRECT_CREATE_TO_LOGIN = f"{LOGIN_URL}?next={POST_CREATE_URL}"
 PROFILE_URL = reverse("posts:profile", args=[AUTHOR_USERNAME])
 MISSING_PAGE_URL = ("/missing/")
 FOLLOW_INDEX_URL = reverse("posts:follow_index")
+SEARCH_URL = reverse("posts:search")
 REDIRECT_FOLLOW_INDEX_TO_LOGIN = f"{LOGIN_URL}?next={FOLLOW_INDEX_URL}"
 PROFILE_FOLLOW_URL = reverse("posts:profile_follow", args=[AUTHOR_USERNAME])
 REDIRECT_FOLLOW_PROFILE_TO_LOGIN = f"{LOGIN_URL}?next={PROFILE_FOLLOW_URL}"
@@ -55,6 +57,7 @@ class URLTests(TestCase):
 
     def setUp(self):
         cache.clear()
+        ObjectCache.clear_local()
 
     def test_urls_exists_at_desired_locations(self):
         """Проверка доступности URL.
@@ -68,6 +71,7 @@ class URLTests(TestCase):
             [POST_CREATE_URL, 200, self.author],
             [self.POST_EDIT_URL, 200, self.author],
             [FOLLOW_INDEX_URL, 200, self.another],
+            [SEARCH_URL, 200, self.guest],
             [POST_CREATE_URL, 302, self.guest],
             [self.POST_EDIT_URL, 302, self.guest],
             [self.POST_EDIT_URL, 302, self.another],
@@ -116,6 +120,7 @@ class URLTests(TestCase):
             self.POST_EDIT_URL: "posts/create_post.html",
             MISSING_PAGE_URL: "core/404.html",
             FOLLOW_INDEX_URL: "posts/follow.html",
+            SEARCH_URL: "posts/search.html",
         }
         for address, template in template_url_names.items():
             with self.subTest(address=address):
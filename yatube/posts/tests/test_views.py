@@ -1,14 +1,27 @@
+import csv
+import io
+import json
 import shutil
 import tempfile
+from datetime import timedelta
 
 from django.conf import settings
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db.models import Count, F
+from django.http import StreamingHttpResponse
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
 
-from posts.models import Comment, Follow, Group, Post, User
-from yatube.settings import POSTS_ON_PAGE
+from core.caching import Cards
+from core.object_cache import ObjectCache
+from posts.imports import IMPORTERS
+from posts.models import (
+    Comment, FeedEntry, Follow, Group, Post, User, UserStats)
+from posts.paginators import CountingPaginator, WindowedPaginator
+from yatube.settings import COMMENTS_ON_PAGE, POSTS_ON_PAGE
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
@@ -26,12 +39,14 @@ SECOND_GGROUP_DESCRIPTION = "Тестовое описание второй гр
 COMMENT_TEXT = "Текст комментария к посту"
 POST_CREATE_URL = reverse("posts:post_create")
 LOGIN_URL = reverse("users:login")
+PASSWORD = "Yatube-2022-password"
 FOLLOW_REDIRECT_CREATE_TO_LOGIN = f"{LOGIN_URL}?next={POST_CREATE_URL}"
 SECOND_GROUP_LIST_URL = reverse("posts:group_list", args=[SECOND_SLUG])
 GROUP_LIST_URL = reverse("posts:group_list", args=[SLUG])
 INDEX_URL = reverse("posts:index")
 PROFILE_URL = reverse("posts:profile", args=[AUTHOR_USERNAME])
 FOLLOW_INDEX_URL = reverse("posts:follow_index")
+SEARCH_URL = reverse("posts:search")
 PROFILE_FOLLOW_URL = reverse("posts:profile_follow", args=[AUTHOR_USERNAME])
 ANOTHER_PROFILE_FOLLOW_URL = reverse(
     "posts:profile_follow", args=[NOT_AUTHOR_USERNAME])
@@ -94,6 +109,7 @@ class YatubeViewsTest(TestCase):
 
     def setUp(self):
         cache.clear()
+        ObjectCache.clear_local()
 
     def test_profile_page_show_correct_context(self):
         """Страница автора формируется с корректным контекстом."""
@@ -151,13 +167,78 @@ class YatubeViewsTest(TestCase):
             response = self.author.get(url)
             self.assertNotIn(self.post, response.context["page_obj"])
 
+    @override_settings(THUMBNAIL_WORKERS=0)
+    def test_thumbnail_is_not_rendered_in_request(self):
+        """Пока превью готовится, вместо картинки выводится заглушка."""
+        post = Post.objects.create(
+            author=self.auth_user,
+            text=POST_TEXT,
+            image=SimpleUploadedFile(
+                name='pending.gif',
+                content=SMALL_GIF,
+                content_type='image/gif'))
+        url = reverse("posts:post_detail", args=[post.id])
+        self.assertContains(self.guest.get(url), "thumbnail-pending")
+        self.assertNotContains(self.guest.get(url), "thumbnail-pending")
+
     def test_cache_from_index_page(self):
+        # Страница с заготовкой превью не кешируется: сначала превью.
+        self.guest.get(INDEX_URL)
         page_content = self.guest.get(INDEX_URL).content
-        Post.objects.all().delete()
+        # Лента выводит сохранённый HTML текста.
+        Post.objects.update(text=SECOND_TEXT, text_html=SECOND_TEXT)
         self.assertEqual(page_content, self.guest.get(INDEX_URL).content)
         cache.clear()
         self.assertNotEqual(page_content, self.guest.get(INDEX_URL).content)
 
+    def test_cached_pages_are_invalidated_by_writes(self):
+        """Новый пост сразу виден на закешированных страницах."""
+        urls = [INDEX_URL, GROUP_LIST_URL, PROFILE_URL]
+        pages = {url: self.guest.get(url).content for url in urls}
+        Post.objects.create(
+            author=self.auth_user, text=SECOND_TEXT, group=self.group)
+        for url in urls:
+            with self.subTest(url=url):
+                content = self.guest.get(url).content
+                self.assertNotEqual(content, pages[url])
+                self.assertIn(SECOND_TEXT, content.decode())
+
+    def test_feed_is_shared_but_header_is_personal(self):
+        """Кешированная лента общая, а шапка своя у каждого читателя."""
+        self.guest.get(INDEX_URL)
+        Post.objects.update(text=SECOND_TEXT)
+        for client, username in [
+            [self.another, NOT_AUTHOR_USERNAME],
+            [self.author, AUTHOR_USERNAME],
+        ]:
+            with self.subTest(username=username):
+                content = client.get(INDEX_URL).content.decode()
+                self.assertIn(POST_TEXT, content)
+                self.assertIn(f"Пользователь: {username}", content)
+
+    @override_settings(FEED_CACHE={
+        "default": {"TIMEOUT": 60, "GRACE": 10, "REFRESH_WORKERS": 1},
+        "posts:index": {"GRACE": 30},
+    })
+    def test_feed_cache_is_configured_per_view(self):
+        """Сроки кеша ленты берутся из настроек её представления."""
+        for url, grace in [[INDEX_URL, 30], [PROFILE_URL, 10]]:
+            with self.subTest(url=url):
+                fragment = self.guest.get(url).context["feed_cache"]
+                self.assertEqual(fragment.timeout, 60)
+                self.assertEqual(fragment.grace, grace)
+                self.assertEqual(fragment.refresh_workers, 1)
+
+    def test_unrelated_writes_keep_pages_cached(self):
+        """Пост в чужой группе не сбрасывает кеш страницы группы."""
+        self.guest.get(GROUP_LIST_URL)
+        page_content = self.guest.get(GROUP_LIST_URL).content
+        Post.objects.update(text=SECOND_TEXT)
+        Post.objects.create(
+            author=self.user, text=SECOND_TEXT, group=self.group2)
+        self.assertEqual(
+            page_content, self.guest.get(GROUP_LIST_URL).content)
+
     def test_subscribe(self):
         """Функция подписки работает правильно."""
         Follow.objects.all().delete()
@@ -215,3 +296,756 @@ class PaginatorViewsTest(TestCase):
                 response = self.guest_client.get(url)
                 self.assertEqual(
                     len(response.context["page_obj"]), posts_count)
+
+    def test_cursor_pages_walk_the_whole_feed(self):
+        """Курсоры ведут по ленте без пропусков и повторов."""
+        Post.objects.update(pub_date=Post.objects.first().pub_date)
+        cache.clear()
+        first_page = self.guest_client.get(INDEX_URL).context["page_obj"]
+        self.assertFalse(first_page.has_previous())
+        second_page = self.guest_client.get(
+            INDEX_URL, {"cursor": first_page.next_cursor}
+        ).context["page_obj"]
+        self.assertFalse(second_page.has_next())
+        self.assertEqual(
+            [post.id for post in list(first_page) + list(second_page)],
+            list(Post.objects.values_list("id", flat=True)))
+        back_page = self.guest_client.get(
+            INDEX_URL, {"cursor": second_page.previous_cursor}
+        ).context["page_obj"]
+        self.assertEqual(list(back_page), list(first_page))
+
+    def test_broken_cursor_opens_first_page(self):
+        """Испорченный курсор открывает первую страницу."""
+        response = self.guest_client.get(PROFILE_URL, {"cursor": "broken"})
+        self.assertEqual(
+            len(response.context["page_obj"]), POSTS_ON_PAGE)
+
+    def test_feed_count_is_cached_until_posts_change(self):
+        """Число постов ленты берётся из кеша, пока лента не изменится."""
+        cache.clear()
+        self.guest_client.get(INDEX_URL, {"page": 1})
+        with self.assertNumQueries(1):
+            self.guest_client.get(INDEX_URL, {"page": 2})
+        Post.objects.create(author=self.user, text=POST_TEXT)
+        self.assertEqual(
+            self.guest_client.get(INDEX_URL, {"page": 2}).context[
+                "page_obj"].paginator.count,
+            self.BATCH_SIZE + 1)
+
+    def test_long_feed_count_is_estimated(self):
+        """Длинная лента не считается целиком, а оценивается по датам."""
+        cache.clear()
+        now = timezone.now()
+        for i, post in enumerate(Post.objects.all()):
+            Post.objects.filter(pk=post.pk).update(
+                pub_date=now - timedelta(hours=i))
+        paginator = CountingPaginator(
+            Post.objects.all(), POSTS_ON_PAGE, "count", 5, None)
+        with self.assertNumQueries(4):
+            self.assertEqual(paginator.count, self.BATCH_SIZE)
+
+    def test_page_range_is_windowed(self):
+        """Ссылки ведут на крайние страницы и соседей текущей."""
+        paginator = WindowedPaginator(
+            range(100 * POSTS_ON_PAGE), POSTS_ON_PAGE)
+        ELLIPSIS = WindowedPaginator.ELLIPSIS
+        set = [
+            [1, [1, 2, 3, 4, ELLIPSIS, 99, 100]],
+            [50, [1, 2, ELLIPSIS, *range(47, 54), ELLIPSIS, 99, 100]],
+            [100, [1, 2, ELLIPSIS, 97, 98, 99, 100]],
+        ]
+        for number, page_range in set:
+            with self.subTest(number=number):
+                self.assertEqual(
+                    paginator.get_page(number).elided_page_range, page_range)
+
+
+class FeedQueriesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username=NOT_AUTHOR_USERNAME)
+        cls.user = User.objects.create_user(username=AUTHOR_USERNAME)
+        cls.group = Group.objects.create(
+            title=GROUP_TITLE,
+            slug=SLUG,
+            description=GROUP_DESCRIPTION,
+        )
+        Follow.objects.create(user=cls.reader, author=cls.user)
+        for i in range(POSTS_ON_PAGE):
+            author = User.objects.create_user(username=f"author{i}")
+            Follow.objects.create(user=cls.reader, author=author)
+            Post.objects.create(
+                author=author,
+                text=f"Текст {i}",
+                group=Group.objects.create(
+                    title=f"Группа {i}", slug=f"group{i}"))
+            Post.objects.create(author=cls.user, text=f"Текст {i}",
+                                group=cls.group)
+        cls.guest = Client()
+        cls.another = Client()
+        cls.another.force_login(cls.reader)
+
+    def setUp(self):
+        cache.clear()
+        ObjectCache.clear_local()
+
+    def test_feeds_do_not_query_authors_and_groups_per_post(self):
+        """Число запросов ленты не зависит от авторов и групп постов."""
+        set = [
+            [INDEX_URL, self.guest, 1],
+            [GROUP_LIST_URL, self.guest, 2],
+            [PROFILE_URL, self.guest, 2],
+            [FOLLOW_INDEX_URL, self.another, 3],
+        ]
+        for url, client, queries in set:
+            with self.subTest(url=url):
+                with self.assertNumQueries(queries):
+                    client.get(url)
+
+
+class FollowFeedTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username=AUTHOR_USERNAME)
+        cls.user = User.objects.create_user(username=NOT_AUTHOR_USERNAME)
+        cls.old_post = Post.objects.create(author=cls.author, text=POST_TEXT)
+        cls.another = Client()
+        cls.another.force_login(cls.user)
+
+    def feed(self):
+        return list(
+            self.another.get(FOLLOW_INDEX_URL).context["page_obj"])
+
+    def test_posts_are_fanned_out_to_followers(self):
+        """Подписка, публикация и отписка меняют материализованную ленту."""
+        self.another.get(PROFILE_FOLLOW_URL)
+        new_post = Post.objects.create(author=self.author, text=SECOND_TEXT)
+        self.assertEqual(
+            set(FeedEntry.objects.values_list("post", flat=True)),
+            {self.old_post.id, new_post.id})
+        self.assertEqual(self.feed(), [new_post, self.old_post])
+        self.assertEqual(
+            {entry.pub_date for entry in FeedEntry.objects.all()},
+            {self.old_post.pub_date, new_post.pub_date})
+        self.another.get(PROFILE_UNFOLLOW_URL)
+        self.assertFalse(FeedEntry.objects.exists())
+        self.assertEqual(self.feed(), [])
+
+    @override_settings(FEED_FANOUT_LIMIT=1)
+    def test_popular_authors_are_merged_on_read(self):
+        """Посты популярных авторов не рассылаются, но видны в ленте."""
+        self.another.get(PROFILE_FOLLOW_URL)
+        new_post = Post.objects.create(author=self.author, text=SECOND_TEXT)
+        self.assertFalse(FeedEntry.objects.exists())
+        self.assertEqual(self.feed(), [new_post, self.old_post])
+
+    @override_settings(FEED_FANOUT_LIMIT=3, FEED_FANOUT_RESUME_LIMIT=2)
+    def test_fan_out_resumes_below_lower_limit(self):
+        """Отписки у границы не дозаполняют ленты, а ниже нижней — да."""
+        followers = [self.user] + [
+            User.objects.create_user(username=f"follower{i}")
+            for i in range(2)
+        ]
+        follows = [
+            Follow.objects.create(user=follower, author=self.author)
+            for follower in followers
+        ]
+        new_post = Post.objects.create(author=self.author, text=SECOND_TEXT)
+        for _ in range(2):
+            follows[-1].delete()
+            follows[-1] = Follow.objects.create(
+                user=followers[-1], author=self.author)
+        self.assertFalse(FeedEntry.objects.filter(post=new_post).exists())
+        self.assertEqual(self.feed(), [new_post, self.old_post])
+        for follow in follows[1:]:
+            follow.delete()
+        self.assertEqual(
+            list(FeedEntry.objects.filter(post=new_post).values_list(
+                "user", flat=True)),
+            [self.user.pk])
+        self.assertEqual(self.feed(), [new_post, self.old_post])
+
+    @override_settings(FEED_FANOUT_LIMIT=2)
+    def test_pages_merge_fanned_out_and_popular_posts(self):
+        """Страницы по курсору сливают разосланные посты и популярных."""
+        popular = User.objects.create_user(username="popular")
+        for follower in [self.user, self.author]:
+            Follow.objects.create(user=follower, author=popular)
+        Follow.objects.create(user=self.user, author=self.author)
+        posts = [
+            Post.objects.create(
+                author=[self.author, popular][i % 2], text=f"Текст {i}")
+            for i in range(POSTS_ON_PAGE + 3)
+        ][::-1] + [self.old_post]
+        first = self.another.get(FOLLOW_INDEX_URL).context["page_obj"]
+        second = self.another.get(
+            FOLLOW_INDEX_URL, {"cursor": first.next_cursor}
+        ).context["page_obj"]
+        previous = self.another.get(
+            FOLLOW_INDEX_URL, {"cursor": second.previous_cursor}
+        ).context["page_obj"]
+        self.assertEqual(list(first), posts[:POSTS_ON_PAGE])
+        self.assertEqual(list(second), posts[POSTS_ON_PAGE:])
+        self.assertEqual(list(previous), list(first))
+        self.assertIsNone(second.next_cursor)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class PostCardCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username=AUTHOR_USERNAME)
+        cls.user = User.objects.create_user(username=NOT_AUTHOR_USERNAME)
+        cls.group = Group.objects.create(title=GROUP_TITLE, slug=SLUG)
+        Follow.objects.create(user=cls.user, author=cls.author)
+        cls.another = Client()
+        cls.another.force_login(cls.user)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        ObjectCache.clear_local()
+        self.post = Post.objects.create(
+            author=self.author, text=POST_TEXT, group=self.group)
+
+    def feed(self):
+        # Лента подписок не кешируется целиком, только карточки постов.
+        return self.another.get(FOLLOW_INDEX_URL).content.decode()
+
+    def test_card_is_reused(self):
+        """Карточка сохраняется и при следующем показе берётся из кеша."""
+        self.feed()
+        cards = Cards(
+            Post.objects.for_feed(), [], settings.CARD_CACHE_TIMEOUT)
+        self.assertEqual(len(cards.found), 1)
+        cache.set(cards.keys[self.post.pk], "Карточка из кеша")
+        self.assertIn("Карточка из кеша", self.feed())
+
+    def test_card_changes_with_its_content(self):
+        """Правка поста, имени автора или группы даёт новую карточку."""
+        changes = [
+            [SECOND_TEXT, lambda: Post.objects.get(pk=self.post.pk).save()],
+            ["Авраам", lambda: User.objects.filter(
+                pk=self.author.pk).update(first_name="Авраам")],
+            [SECOND_GROUP_TITLE, lambda: Group.objects.filter(
+                pk=self.group.pk).update(title=SECOND_GROUP_TITLE)],
+        ]
+        for text, change in changes:
+            with self.subTest(text=text):
+                self.feed()
+                Post.objects.filter(pk=self.post.pk).update(text=SECOND_TEXT)
+                change()
+                self.assertIn(text, self.feed())
+
+    @override_settings(THUMBNAIL_WORKERS=0)
+    def test_card_with_pending_thumbnail_is_not_cached(self):
+        """Карточка с заглушкой вместо превью не попадает в кеш."""
+        self.post.image = SimpleUploadedFile(
+            name='card.gif', content=SMALL_GIF, content_type='image/gif')
+        self.post.save()
+        self.assertIn("thumbnail-pending", self.feed())
+        self.assertNotIn("thumbnail-pending", self.feed())
+
+    @override_settings(THUMBNAIL_WORKERS=0)
+    def test_feed_page_with_pending_thumbnail_is_not_cached(self):
+        """Лента с заглушкой вместо превью не попадает в кеш."""
+        for index, url in enumerate([INDEX_URL, GROUP_LIST_URL, PROFILE_URL]):
+            with self.subTest(url=url):
+                Post.objects.create(
+                    author=self.author, text=POST_TEXT, group=self.group,
+                    image=SimpleUploadedFile(
+                        name=f'feed{index}.gif', content=SMALL_GIF,
+                        content_type='image/gif'))
+                client = Client()
+                self.assertContains(client.get(url), "thumbnail-pending")
+                self.assertNotContains(client.get(url), "thumbnail-pending")
+
+
+class CommentsViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username=AUTHOR_USERNAME)
+        cls.post = Post.objects.create(author=cls.author, text=POST_TEXT)
+        cls.COMMENTS_COUNT = COMMENTS_ON_PAGE + 3
+        for i in range(cls.COMMENTS_COUNT):
+            Comment.objects.create(
+                post=cls.post,
+                author=User.objects.create_user(username=f"reader{i}"),
+                text=f"{COMMENT_TEXT} {i}")
+        cls.URL = reverse("posts:post_detail", args=[cls.post.id])
+        cls.guest = Client()
+
+    def setUp(self):
+        cache.clear()
+        ObjectCache.clear_local()
+
+    def test_comments_do_not_query_authors_per_comment(self):
+        """Запросы страницы поста не зависят от числа комментаторов."""
+        with self.assertNumQueries(3):
+            self.guest.get(self.URL)
+        with self.assertNumQueries(2):
+            self.guest.get(self.URL)
+
+    def test_comments_are_paginated_by_cursor(self):
+        """Длинное обсуждение листается курсором в порядке написания."""
+        first = self.guest.get(self.URL).context
+        self.assertEqual(first["comments_count"], self.COMMENTS_COUNT)
+        self.assertEqual(
+            [comment.text for comment in first["comments"]],
+            [f"{COMMENT_TEXT} {i}" for i in range(COMMENTS_ON_PAGE)])
+        second = self.guest.get(
+            self.URL, {"cursor": first["comments"].next_cursor}).context
+        self.assertEqual(
+            [comment.text for comment in second["comments"]],
+            [f"{COMMENT_TEXT} {i}"
+             for i in range(COMMENTS_ON_PAGE, self.COMMENTS_COUNT)])
+
+    def test_comments_count_is_invalidated_by_new_comment(self):
+        """Новый комментарий сразу учитывается в закешированном числе."""
+        self.guest.get(self.URL)
+        Comment.objects.create(
+            post=self.post, author=self.author, text=COMMENT_TEXT)
+        self.assertEqual(
+            self.guest.get(self.URL).context["comments_count"],
+            self.COMMENTS_COUNT + 1)
+
+
+class SearchViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username=AUTHOR_USERNAME)
+        cls.another = User.objects.create_user(username=NOT_AUTHOR_USERNAME)
+        cls.group = Group.objects.create(
+            title=GROUP_TITLE,
+            slug=SLUG,
+            description=GROUP_DESCRIPTION,
+        )
+        cls.rare = Post.objects.create(
+            author=cls.author, text="Кошка спит на диване")
+        cls.frequent = Post.objects.create(
+            author=cls.another,
+            group=cls.group,
+            text="Кошки, кошки, кошки повсюду")
+        cls.unrelated = Post.objects.create(
+            author=cls.author, text=SECOND_TEXT)
+        cls.guest = Client()
+
+    def search(self, **params):
+        return list(
+            self.guest.get(SEARCH_URL, params).context["page_obj"])
+
+    def test_search_ranks_posts_by_relevance(self):
+        """Находятся посты со словом запроса, частые совпадения выше."""
+        self.assertEqual(self.search(q="КОШ"), [self.frequent, self.rare])
+        self.assertEqual(self.search(q='кош "диван'), [self.rare])
+
+    def test_search_is_filtered_by_group_and_author(self):
+        """Поиск сужается до группы и автора."""
+        set = [
+            [{"group": SLUG}, [self.frequent]],
+            [{"author": AUTHOR_USERNAME}, [self.rare]],
+        ]
+        for params, posts in set:
+            with self.subTest(params=params):
+                self.assertEqual(self.search(q="кош", **params), posts)
+
+    def test_index_follows_post_changes(self):
+        """Индекс обновляется при правке и удалении постов."""
+        Post.objects.filter(pk=self.unrelated.pk).update(text="Кошка")
+        Post.objects.filter(pk=self.rare.pk).delete()
+        self.assertEqual(
+            self.search(q="кош"), [self.frequent, self.unrelated])
+
+    def test_search_pages_keep_the_query(self):
+        """Ссылки на следующие страницы поиска сохраняют запрос."""
+        Post.objects.bulk_create(
+            Post(author=self.author, text=f"Кошка {i}")
+            for i in range(POSTS_ON_PAGE))
+        response = self.guest.get(SEARCH_URL, {"q": "кошка"})
+        next_cursor = response.context["page_obj"].next_cursor
+        self.assertContains(response, "?q=%D0%BA%D0%BE%D1%88%D0%BA%D0%B0")
+        second_page = self.guest.get(
+            SEARCH_URL, {"q": "кошка", "cursor": next_cursor}
+        ).context["page_obj"]
+        self.assertEqual(
+            len(second_page),
+            Post.objects.search("кошка").count() - POSTS_ON_PAGE)
+
+    def test_admin_search_uses_index(self):
+        """Поиск в админке идёт по тому же индексу."""
+        admin = Client()
+        admin.force_login(User.objects.create_superuser(
+            "admin", "admin@example.com", "password"))
+        response = admin.get(
+            reverse("admin:posts_post_changelist"), {"q": "кош"})
+        self.assertCountEqual(
+            response.context["cl"].result_list, [self.rare, self.frequent])
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username=AUTHOR_USERNAME)
+        cls.reader = User.objects.create_user(username=NOT_AUTHOR_USERNAME)
+        cls.group = Group.objects.create(
+            title=GROUP_TITLE,
+            slug=SLUG,
+            description=GROUP_DESCRIPTION,
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, text=POST_TEXT, group=cls.group)
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.POST_DETAIL_URL = reverse("posts:post_detail", args=[cls.post.id])
+        cls.guest = Client()
+        cls.another = Client()
+        cls.another.force_login(cls.reader)
+
+    def test_unchanged_pages_are_not_modified(self):
+        """Неизменная страница отдаётся как 304 без обращения к базе."""
+        set = [
+            [INDEX_URL, self.guest, 0],
+            [GROUP_LIST_URL, self.guest, 0],
+            [PROFILE_URL, self.guest, 0],
+            [self.POST_DETAIL_URL, self.guest, 0],
+            [FOLLOW_INDEX_URL, self.another, 2],
+        ]
+        for url, client, queries in set:
+            with self.subTest(url=url):
+                etag = client.get(url)["ETag"]
+                with self.assertNumQueries(queries):
+                    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+
+    def test_changed_pages_are_rendered_again(self):
+        """После новых данных страница рисуется заново."""
+        urls = [INDEX_URL, GROUP_LIST_URL, PROFILE_URL, FOLLOW_INDEX_URL]
+        etags = {url: self.another.get(url)["ETag"] for url in urls}
+        Post.objects.create(
+            author=self.author, text=SECOND_TEXT, group=self.group)
+        etags[self.POST_DETAIL_URL] = self.another.get(
+            self.POST_DETAIL_URL)["ETag"]
+        Comment.objects.create(
+            post=self.post, author=self.reader, text=COMMENT_TEXT)
+        for url, etag in etags.items():
+            with self.subTest(url=url):
+                self.assertEqual(
+                    self.another.get(
+                        url, HTTP_IF_NONE_MATCH=etag).status_code,
+                    200)
+
+    def test_pages_of_different_readers_differ(self):
+        """Страница с шапкой читателя не отдаётся как 304 другому."""
+        etag = self.guest.get(INDEX_URL)["ETag"]
+        self.assertEqual(
+            self.another.get(
+                INDEX_URL, HTTP_IF_NONE_MATCH=etag).status_code,
+            200)
+
+    @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+    def test_page_with_pending_thumbnail_has_no_etag(self):
+        """Страница с заглушкой вместо превью отдаётся без ETag."""
+        self.addCleanup(shutil.rmtree, TEMP_MEDIA_ROOT, ignore_errors=True)
+        for url in [INDEX_URL, self.POST_DETAIL_URL]:
+            with self.subTest(url=url):
+                # Превью рисуется после ответа, поэтому картинка новая.
+                self.post.image = SimpleUploadedFile(
+                    name='etag.gif', content=SMALL_GIF,
+                    content_type='image/gif')
+                self.post.save()
+                self.assertNotIn("ETag", self.guest.get(url))
+
+    def test_page_with_form_is_rendered_after_new_login(self):
+        """После нового входа форма рисуется с новым CSRF-токеном."""
+        self.reader.set_password(PASSWORD)
+        self.reader.save()
+        credentials = {"username": NOT_AUTHOR_USERNAME, "password": PASSWORD}
+        client = Client()
+        client.post(LOGIN_URL, credentials)
+        etag = client.get(self.POST_DETAIL_URL)["ETag"]
+        client.logout()
+        client.post(LOGIN_URL, credentials)
+        self.assertEqual(
+            client.get(
+                self.POST_DETAIL_URL, HTTP_IF_NONE_MATCH=etag).status_code,
+            200)
+
+
+class ExportTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username=AUTHOR_USERNAME)
+        cls.reader = User.objects.create_user(username=NOT_AUTHOR_USERNAME)
+        cls.group = Group.objects.create(
+            title=GROUP_TITLE,
+            slug=SLUG,
+            description=GROUP_DESCRIPTION,
+        )
+        cls.posts = [
+            Post.objects.create(
+                author=cls.author, text=f"Текст {i}", group=cls.group)
+            for i in range(5)
+        ]
+        cls.other_post = Post.objects.create(
+            author=cls.reader, text=SECOND_TEXT)
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.staff = Client()
+        cls.staff.force_login(User.objects.create_user(
+            username="staff", is_staff=True))
+        cls.another = Client()
+        cls.another.force_login(cls.reader)
+
+    def export(self, kind, **params):
+        response = self.staff.get(
+            reverse("posts:export", args=[kind]), params)
+        self.assertIsInstance(response, StreamingHttpResponse)
+        return b"".join(response.streaming_content).decode()
+
+    def test_export_is_for_staff_only(self):
+        """Выгрузка недоступна обычным пользователям."""
+        response = self.another.get(reverse("posts:export", args=["posts"]))
+        self.assertEqual(response.status_code, 302)
+
+    def test_posts_are_exported_by_chunks_after_cursor(self):
+        """Выгрузка фильтруется и продолжается после заданного id."""
+        rows = [
+            json.loads(line)
+            for line in self.export(
+                "posts",
+                group=SLUG,
+                author=AUTHOR_USERNAME,
+                after=self.posts[1].id,
+            ).splitlines()
+        ]
+        self.assertEqual(
+            [row["id"] for row in rows],
+            [post.id for post in self.posts[2:]])
+        self.assertEqual(rows[0]["group__slug"], SLUG)
+
+    def test_follows_are_exported_as_csv(self):
+        """Подписки выгружаются в CSV с заголовком."""
+        self.assertEqual(
+            list(csv.reader(
+                io.StringIO(self.export("follows", format="csv")))),
+            [
+                ["id", "user__username", "author__username"],
+                [str(Follow.objects.get().id),
+                 NOT_AUTHOR_USERNAME, AUTHOR_USERNAME],
+            ])
+
+    def test_inapplicable_filter_is_rejected(self):
+        """У подписок нет даты, фильтр по ней — ошибка запроса."""
+        response = self.staff.get(
+            reverse("posts:export", args=["follows"]),
+            {"since": "2020-01-01"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_export_command_resumes_from_cursor(self):
+        """Команда выгружает строки после --after-id порциями."""
+        out = io.StringIO()
+        call_command(
+            "export_data", "posts",
+            after_id=self.posts[0].id, chunk_size=2, stdout=out)
+        self.assertEqual(
+            [json.loads(line)["id"] for line in out.getvalue().splitlines()],
+            [post.id for post in self.posts[1:]] + [self.other_post.id])
+
+
+class ImportTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username=AUTHOR_USERNAME)
+        self.reader = User.objects.create_user(username=NOT_AUTHOR_USERNAME)
+        self.group = Group.objects.create(title=GROUP_TITLE, slug=SLUG)
+        self.posts = [
+            Post.objects.create(
+                author=self.author, text=f"Текст {i}", group=self.group)
+            for i in range(3)
+        ]
+        Follow.objects.create(user=self.reader, author=self.author)
+
+    def dump_and_load(self, kind, format):
+        """Выгрузить таблицу, очистить её и загрузить заново."""
+        out = io.StringIO()
+        call_command("export_data", kind, format=format, stdout=out)
+        IMPORTERS[kind].model.objects.all().delete()
+        with tempfile.NamedTemporaryFile(
+                "w", suffix=f".{format}", encoding="utf-8") as file:
+            file.write(out.getvalue())
+            file.flush()
+            call_command(
+                "import_posts", kind, file.name, batch_size=2,
+                stdout=io.StringIO())
+
+    def test_posts_keep_ids_and_dates(self):
+        """Посты возвращаются с теми же id, датами и группами."""
+        expected = list(Post.objects.values_list(
+            "id", "pub_date", "text", "group__slug", "author__username"))
+        self.dump_and_load("posts", "csv")
+        self.assertEqual(
+            list(Post.objects.values_list(
+                "id", "pub_date", "text", "group__slug",
+                "author__username")),
+            expected)
+        self.assertEqual(self.author.stats.posts_count, 3)
+
+    def test_follows_restore_feed(self):
+        """Загруженные подписки заполняют ленту подписчика."""
+        self.dump_and_load("follows", "jsonl")
+        self.assertTrue(Follow.objects.filter(
+            user=self.reader, author=self.author).exists())
+        self.assertCountEqual(
+            FeedEntry.objects.filter(user=self.reader).values_list(
+                "post_id", flat=True),
+            [post.id for post in self.posts])
+
+    def test_imported_posts_are_not_cached_as_missing(self):
+        """Адреса загруженных постов больше не отвечают 404 из кеша."""
+        missing = self.posts[-1].id + 1
+        urls = [
+            reverse("posts:post_detail", args=[post_id])
+            for post_id in (self.posts[0].id, missing)
+        ]
+        Post.objects.all().delete()
+        for url in urls:
+            self.assertEqual(self.client.get(url).status_code, 404)
+        with tempfile.NamedTemporaryFile(
+                "w", suffix=".jsonl", encoding="utf-8") as file:
+            for row in [
+                {"id": self.posts[0].id, "text": POST_TEXT},
+                {"text": SECOND_TEXT},
+            ]:
+                file.write(json.dumps(
+                    {"author__username": AUTHOR_USERNAME, **row}) + "\n")
+            file.flush()
+            call_command(
+                "import_posts", "posts", file.name, stdout=io.StringIO())
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_unknown_authors_are_created(self):
+        """Авторы, которых нет в базе, создаются без пароля."""
+        with tempfile.NamedTemporaryFile(
+                "w", suffix=".jsonl", encoding="utf-8") as file:
+            file.write(json.dumps(
+                {"author__username": "newcomer", "text": POST_TEXT}) + "\n")
+            file.flush()
+            call_command(
+                "import_posts", "posts", file.name, stdout=io.StringIO())
+        post = Post.objects.get(author__username="newcomer")
+        self.assertEqual(post.text, POST_TEXT)
+        self.assertFalse(post.author.has_usable_password())
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class SeedLoadTest(TestCase):
+    OPTIONS = {
+        "users": 30,
+        "groups": 3,
+        "posts": 200,
+        "comments": 100,
+        "following": 3,
+        "hot_posts": 0.01,
+        "hot_comments": 0.8,
+        "images": 0.5,
+        "image_pool": 2,
+    }
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def seed(self):
+        call_command("seed_load", stdout=io.StringIO(), **self.OPTIONS)
+        return list(Post.objects.order_by("id").values_list(
+            "author__username", "group__slug", "text", "image", "pub_date"))
+
+    def test_seed_is_deterministic(self):
+        """Одно и то же зерно на пустой базе даёт те же данные."""
+        posts = self.seed()
+        User.objects.all().delete()
+        Group.objects.all().delete()
+        self.assertEqual(self.seed(), posts)
+
+    def test_dataset_shape(self):
+        """Подписчики и комментарии распределены неравномерно."""
+        self.seed()
+        self.assertEqual(Post.objects.count(), self.OPTIONS["posts"])
+        self.assertEqual(Comment.objects.count(), self.OPTIONS["comments"])
+        self.assertFalse(Follow.objects.filter(user=F("author")).exists())
+        followers = list(UserStats.objects.order_by(
+            "-followers_count").values_list("followers_count", flat=True))
+        self.assertGreater(followers[0], 5 * followers[-1] + 1)
+        hot = Post.objects.annotate(
+            comments_count=Count("comments")).order_by("-comments_count")
+        self.assertGreater(
+            sum(post.comments_count for post in hot[:2]),
+            self.OPTIONS["comments"] // 2)
+        self.assertTrue(Post.objects.exclude(image="").exists())
+        self.assertTrue(FeedEntry.objects.exists())
+
+
+class BenchWsgiTest(TestCase):
+    def setUp(self):
+        author = User.objects.create_user(username=AUTHOR_USERNAME)
+        reader = User.objects.create_user(username=NOT_AUTHOR_USERNAME)
+        group = Group.objects.create(title=GROUP_TITLE, slug=SLUG)
+        for i in range(3):
+            Post.objects.create(author=author, text=POST_TEXT, group=group)
+        Follow.objects.create(user=reader, author=author)
+
+    def test_report_is_saved_and_compared(self):
+        """Все маршруты смеси отвечают без ошибок, отчёт пишется в JSON."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = f"{directory}/bench.json"
+            options = {"requests": 40, "warmup": 0, "workers": 1}
+            call_command(
+                "bench_wsgi", output=path, stdout=io.StringIO(), **options)
+            with open(path, encoding="utf-8") as file:
+                report = json.load(file)
+            out = io.StringIO()
+            call_command(
+                "bench_wsgi", baseline=path, stdout=out, **options)
+        self.assertEqual(report["total"]["requests"], 40)
+        self.assertEqual(report["total"]["errors"], 0)
+        self.assertGreater(report["total"]["queries"], 0)
+        self.assertLessEqual(
+            report["total"]["p50"], report["total"]["p99"])
+        self.assertIn("к базовому", out.getvalue())
+        self.assertTrue(Comment.objects.exists())
+
+    def test_requests_must_be_positive(self):
+        """Замер без запросов отклоняется, а не делит на ноль."""
+        with self.assertRaises(CommandError):
+            call_command(
+                "bench_wsgi", requests=0, warmup=0, stdout=io.StringIO())
+
+
+class BenchQueriesTest(TestCase):
+    def test_feed_queries_are_reported(self):
+        """Замер лент заполняет свою базу и печатает планы запросов."""
+        out = io.StringIO()
+        call_command(
+            "bench_feed_queries", posts=200, authors=20, groups=3,
+            following=5, repeat=1, stdout=out)
+        self.assertIn("с индексами", out.getvalue())
+        self.assertIn("follow: медиана", out.getvalue())
+
+    def test_search_is_reported(self):
+        """Замер поиска сравнивает LIKE с полнотекстовым индексом."""
+        out = io.StringIO()
+        call_command(
+            "bench_search", posts=200, words=400, repeat=1, stdout=out)
+        self.assertIn("FTS5, первая страница", out.getvalue())
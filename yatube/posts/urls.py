@@ -9,6 +9,8 @@ urlpatterns = [
     path("group/<slug:slug>/", views.group_posts, name="group_list"),
     path("profile/<str:username>/", views.profile, name="profile"),
     path("posts/<int:post_id>/", views.post_detail, name="post_detail"),
+    path("search/", views.search, name="search"),
+    path("export/<str:kind>/", views.export, name="export"),
     path("create/", views.post_create, name="post_create"),
     path("posts/<int:post_id>/edit/", views.post_edit, name="post_edit"),
     path(
@@ -1,38 +1,115 @@
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
+from django.http import Http404, HttpResponseBadRequest, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
+from django.utils.functional import SimpleLazyObject
+
+from core.caching import (
+    Fragment, get_or_set, get_version, page_condition, page_etag)
+from yatube.settings import (
+    COMMENTS_ON_PAGE, FEED_CACHE_TIMEOUT, FEED_EXACT_COUNT_LIMIT,
+    POSTS_ON_PAGE)
+from . import object_caches
+from .export import EXPORTS, FORMATS, render as render_export
+from .forms import CommentForm, ExportForm, PostForm, SearchForm
+from .models import Follow, Post, User, UserStats
+from .paginators import (
+    CountingPaginator, KeysetPaginator, MergedKeysetPaginator)
+
+
+def paginator_view(request, post_list, count_key, keyset=None):
+    """Страница ленты: по номеру, если он задан, иначе по курсору.
+
+    ``count_key`` — ключ кеша для числа постов ленты, включающий версию
+    её данных. ``keyset`` — свой пагинатор для листания курсором.
+    """
+    if "page" in request.GET:
+        return CountingPaginator(
+            post_list,
+            POSTS_ON_PAGE,
+            count_key,
+            FEED_EXACT_COUNT_LIMIT,
+            FEED_CACHE_TIMEOUT,
+        ).get_page(request.GET.get("page"))
+    if keyset is None:
+        keyset = KeysetPaginator(post_list, POSTS_ON_PAGE)
+    return keyset.get_page(request.GET.get("cursor"))
+
+
+def feed_context(request, post_list, scopes):
+    """Контекст ленты, список постов которой общий для всех читателей.
+
+    Посты и пагинатор кешируются с версией данных ``scopes``, а шапка,
+    переключатель лент и кнопки подписки рисуются для каждого запроса.
+    Страница ленты вычисляется лениво, только если фрагмента нет в кеше.
+    Сроки кеша и число фоновых потоков обновления берутся из
+    FEED_CACHE по имени представления.
+    """
+    version = get_version(*scopes)
+    view_name = request.resolver_match.view_name
+    config = {
+        **settings.FEED_CACHE["default"],
+        **settings.FEED_CACHE.get(view_name, {}),
+    }
+    return {
+        "page_obj": SimpleLazyObject(lambda: paginator_view(
+            request, post_list, f"feed_count:{request.path}:{version}")),
+        "feed_cache": Fragment(
+            view_name,
+            [version, request.get_full_path()],
+            config["TIMEOUT"],
+            config["GRACE"],
+            config["REFRESH_WORKERS"]),
+    }
 
-from yatube.settings import POSTS_ON_PAGE
-from .forms import CommentForm, PostForm
-from .models import Follow, Group, Post, User
 
+def comments_context(request, post):
+    """Страница комментариев поста и их общее число.
 
-def paginator_view(request, post_list):
-    return Paginator(post_list, POSTS_ON_PAGE).get_page(
-        request.GET.get("page"))
+    Комментарии листаются курсором, а число кешируется с версией поста,
+    которую сдвигает каждый новый или удалённый комментарий.
+    """
+    return {
+        "comments": KeysetPaginator(
+            post.comments.for_thread(), COMMENTS_ON_PAGE
+        ).get_page(request.GET.get("cursor")),
+        "comments_count": get_or_set(
+            f"comments_count:{post.pk}:{get_version(f'post:{post.pk}')}",
+            post.comments.count),
+    }
 
 
-@cache_page(20)
+@page_condition(lambda request: page_etag(request, "posts"))
 def index(request):
-    return render(request, "posts/index.html", {
-        "page_obj": paginator_view(request, Post.objects.all())
-    })
+    return render(request, "posts/index.html", feed_context(
+        request, Post.objects.for_feed(), ["posts"]))
 
 
+@page_condition(lambda request, slug: page_etag(
+    request, f"group:{slug}", "users"))
 def group_posts(request, slug):
-    group = get_object_or_404(Group, slug=slug)
+    group = object_caches.groups.get_or_404(slug=slug)
     return render(request, "posts/group_list.html", {
         "group": group,
-        "page_obj": paginator_view(request, group.posts.all())
+        **feed_context(
+            request,
+            group.posts.for_feed(),
+            [f"group:{slug}", "users"]),
     })
 
 
+@page_condition(lambda request, username: page_etag(
+    request, f"author:{username}", "groups"))
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
+    author = object_caches.users.get_or_404(username=username)
     return render(request, "posts/profile.html", {
         "author": author,
-        "page_obj": paginator_view(request, author.posts.all()),
+        "stats": UserStats.objects.for_user(author),
+        **feed_context(
+            request,
+            author.posts.for_feed(),
+            [f"author:{username}", "groups"]),
         "following": (
             request.user != author
             and request.user.is_authenticated
@@ -43,13 +120,40 @@ def profile(request, username):
     })
 
 
+# Пост, комментарии к нему и счётчики автора меняются вместе с поколениями
+# поста и всех постов, а имена комментаторов — с поколением пользователей.
+@page_condition(lambda request, post_id: page_etag(
+    request, f"post:{post_id}", "posts", "users"))
 def post_detail(request, post_id):
+    post = object_caches.posts.get_or_404(pk=post_id)
     return render(request, "posts/post_detail.html", {
-        "post": get_object_or_404(Post, id=post_id),
+        "post": post,
+        "stats": UserStats.objects.for_user(post.author),
         "form": CommentForm(request.POST or None),
+        **comments_context(request, post),
     })
 
 
+def search(request):
+    form = SearchForm(request.GET or None)
+    context = {"form": form}
+    if form.is_valid():
+        post_list = Post.objects.for_feed().search(form.cleaned_data["q"])
+        if form.cleaned_data["group"]:
+            post_list = post_list.filter(group=form.cleaned_data["group"])
+        if form.cleaned_data["author"]:
+            post_list = post_list.filter(
+                author__username=form.cleaned_data["author"])
+        params = request.GET.copy()
+        params.pop("cursor", None)
+        context.update({
+            "page_obj": KeysetPaginator(post_list, POSTS_ON_PAGE).get_page(
+                request.GET.get("cursor")),
+            "params": params.urlencode(),
+        })
+    return render(request, "posts/search.html", context)
+
+
 @login_required
 def post_create(request):
     template = "posts/create_post.html"
@@ -64,6 +168,7 @@ def post_create(request):
 
 @login_required
 def post_edit(request, post_id):
+    # Изменяемый объект читается из базы, а не из кеша объектов.
     post = get_object_or_404(Post, pk=post_id)
     if post.author != request.user:
         return redirect("posts:post_detail", post_id=post_id)
@@ -84,7 +189,7 @@ def post_edit(request, post_id):
 
 @login_required
 def add_comment(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
+    post = get_object_or_404(Post, pk=post_id)
     form = CommentForm(request.POST or None)
     if form.is_valid():
         comment = form.save(commit=False)
@@ -95,11 +200,21 @@ def add_comment(request, post_id):
 
 
 @login_required
+@page_condition(lambda request: page_etag(
+    request, "posts", f"author:{request.user.username}"))
 def follow_index(request):
+    posts = Post.objects.for_feed()
     return render(request, "posts/follow.html", {
         "page_obj": paginator_view(
             request,
-            Post.objects.filter(author__following__user=request.user))
+            posts.for_follower(request.user),
+            # Ленту подписок меняют любые новые посты и свои подписки.
+            "feed_count:follow:%s:%s" % (request.user.pk, get_version(
+                "posts", f"author:{request.user.username}")),
+            MergedKeysetPaginator(
+                posts,
+                POSTS_ON_PAGE,
+                posts.follower_sources(request.user))),
     })
 
 
@@ -116,3 +231,25 @@ def profile_unfollow(request, username):
     get_object_or_404(
         Follow, user=request.user, author__username=username).delete()
     return redirect('posts:profile', username=username)
+
+
+@staff_member_required
+def export(request, kind):
+    if kind not in EXPORTS:
+        raise Http404
+    form = ExportForm(request.GET)
+    if not form.is_valid():
+        return HttpResponseBadRequest(form.errors.as_text())
+    filters = dict(form.cleaned_data)
+    format = filters.pop("format") or "jsonl"
+    table = EXPORTS[kind]
+    try:
+        rows = table.rows(after=filters.pop("after") or 0, **filters)
+    except ValueError as error:
+        return HttpResponseBadRequest(str(error))
+    response = StreamingHttpResponse(
+        render_export(rows, table.fields, format),
+        content_type=f"{FORMATS[format]}; charset=utf-8")
+    response["Content-Disposition"] = (
+        f'attachment; filename="{kind}.{format}"')
+    return response
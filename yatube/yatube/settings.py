@@ -17,7 +17,7 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 SECRET_KEY = "!ac^#b-45_c@idq#c@=3fr-uj#3a)*l#vtc^-yd#j$p$i*h9x#"
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.getenv('DJANGO_DEBUG', '1') == '1'
 
 ALLOWED_HOSTS = [
     'localhost',
@@ -44,6 +44,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "core.middleware.MetricsMiddleware",
+    "core.middleware.SlowQueryMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -58,7 +60,7 @@ ROOT_URLCONF = "yatube.urls"
 TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        "BACKEND": "core.metrics.DjangoTemplates",
         "DIRS": [TEMPLATES_DIR],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -87,10 +89,24 @@ DATABASES = {
 }
 
 
-CACHES = {
-    'default': {
+# locmem — отдельный кеш в памяти каждого процесса, удобен для разработки;
+# shared — один кеш в файле SQLite для всех воркеров на машине.
+CACHE_BACKENDS = {
+    'locmem': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+    },
+    'shared': {
+        'BACKEND': 'core.cache_backends.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+            'MAX_SIZE': 256 * 1024 * 1024,
+        },
+    },
+}
+CACHES = {
+    'default': CACHE_BACKENDS[
+        os.getenv('CACHE_BACKEND', 'locmem' if DEBUG else 'shared')],
 }
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -132,4 +148,83 @@ LOGIN_REDIRECT_URL = "posts:index"
 STATIC_URL = "/static/"
 STATICFILES_DIRS = [os.path.join(BASE_DIR, "static")]
 POSTS_ON_PAGE = 10
+COMMENTS_ON_PAGE = 20
+# Ленты сбрасываются из кеша при изменении их данных, поэтому живут долго.
+FEED_CACHE_TIMEOUT = 60 * 60
+# Кеш страниц лент по представлениям. После TIMEOUT секунд страница ещё
+# GRACE секунд отдаётся устаревшей, пока её заново рисует один из
+# REFRESH_WORKERS фоновых потоков представления; 0 — рисовать в запросе.
+# Изменение данных ленты по-прежнему сбрасывает страницу сразу.
+FEED_CACHE = {
+    "default": {
+        "TIMEOUT": FEED_CACHE_TIMEOUT,
+        "GRACE": 5 * 60,
+        "REFRESH_WORKERS": 1,
+    },
+    "posts:index": {"TIMEOUT": 5 * 60, "GRACE": 60, "REFRESH_WORKERS": 2},
+}
+# Версия карточки поста меняется вместе с её содержимым, сбрасывать её
+# не нужно: срок нужен только чтобы не держать карточки старых постов.
+CARD_CACHE_TIMEOUT = 24 * 60 * 60
+# Посты, группы и пользователи по ключу (core.object_cache): записи
+# сбрасываются при сохранении, отсутствие объекта помнится недолго.
+OBJECT_CACHE_TIMEOUT = 60 * 60
+OBJECT_CACHE_MISSING_TIMEOUT = 60
+# Копия в памяти процесса; в других процессах правка видна не позже, чем
+# через OBJECT_CACHE_LOCAL_TIMEOUT секунд.
+OBJECT_CACHE_LOCAL_SIZE = 1000
+OBJECT_CACHE_LOCAL_TIMEOUT = 2
+# Одновременные промахи по ключу кеша ждут первого из них не дольше
+# SINGLE_FLIGHT_WAIT секунд; блокировка ключа снимается сама через
+# SINGLE_FLIGHT_LOCK_TIMEOUT, если её владелец упал.
+SINGLE_FLIGHT_WAIT = 2
+SINGLE_FLIGHT_LOCK_TIMEOUT = 30
+# Ленты длиннее этого числа постов не пересчитываются, а оцениваются.
+FEED_EXACT_COUNT_LIMIT = 10_000
+# Посты авторов, у которых подписчиков не меньше этого числа, не рассылаются
+# по лентам при публикации, а подмешиваются в ленту подписок при чтении.
+FEED_FANOUT_LIMIT = 1000
+# Рассылка постов такого автора возобновляется, только когда подписчиков
+# станет меньше этого числа: иначе ленты дозаполнялись бы заново на каждой
+# паре подписки и отписки у границы.
+FEED_FANOUT_RESUME_LIMIT = 900
+# Сколько последних постов автора попадает в ленту при новой подписке.
+FEED_BACKFILL_LIMIT = 1000
+FEED_BATCH_SIZE = 500
+# Превью картинок постов рисуются в фоне; 0 — рисовать сразу в запросе.
+THUMBNAIL_WORKERS = 2
+POST_IMAGE_THUMBNAILS = (
+    ("960x339", {"crop": "center", "upscale": True}),
+)
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
+# Метрики по представлениям для Prometheus на /metrics/ (только персоналу).
+METRICS_ENABLED = os.getenv('METRICS_ENABLED') == '1'
+# Запросы к базе не короче этого числа секунд пишутся в журнал медленных
+# запросов (core.slow_queries), для доли из них — с планом. Работает и без
+# DEBUG; SLOW_QUERY_LOG — путь ротируемого файла журнала.
+SLOW_QUERY_THRESHOLD = float(os.getenv('SLOW_QUERY_THRESHOLD', 0.1))
+SLOW_QUERY_EXPLAIN_RATE = 0.1
+SLOW_QUERY_LOG_SIZE = 200
+SLOW_QUERY_LOG = os.getenv('SLOW_QUERY_LOG')
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'slow_queries': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': SLOW_QUERY_LOG,
+            'maxBytes': 10 * 1024 * 1024,
+            'backupCount': 5,
+            'encoding': 'utf-8',
+        } if SLOW_QUERY_LOG else {
+            'class': 'logging.NullHandler',
+        },
+    },
+    'loggers': {
+        'core.slow_queries': {
+            'handlers': ['slow_queries'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
@@ -3,12 +3,17 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
 
+from core.views import metrics_view, slow_queries_view
+
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("auth/", include("users.urls", namespace="users")),
     path("auth/", include("django.contrib.auth.urls")),
     path("", include("posts.urls", namespace="posts")),
     path("about/", include("about.urls", namespace="about")),
+    path("metrics/", metrics_view, name="metrics"),
+    path(
+        "metrics/slow-queries/", slow_queries_view, name="slow_queries"),
 ]
 handler500 = "core.views.server_error"
 handler403 = "core.views.permission_denied"